@@ -1,7 +1,19 @@
 import pygame
 import sys
+import os
 import math
+import re
+import json
 import random
+import struct
+import mmap
+import argparse
+import time
+import signal
+import atexit
+import queue
+import ctypes
+import multiprocessing
 
 pygame.init()
 
@@ -24,13 +36,46 @@ pygame.display.set_caption("Castling the King - CRSS")
 CLOCK = pygame.time.Clock()
 
 # Global game state variables
-game_state = "menu"  # "menu", "playing", "game_over"
+game_state = "menu"  # "menu", "playing", "game_over", "replay"
 player_mode = None  # "1player" or "2player"
 cpu_thinking = False
 button_1p = None
 button_2p = None
 back_button = None
 
+# Background engine process (1-player mode)
+CPU_THINK_TIME = 1.0  # seconds the CPU searches for each move
+engine_process = None
+engine_conn = None
+engine_search_id = 0
+ponder_move = None  # human reply the engine is pondering on, if any
+SEARCH_PROCESSES = 1  # Lazy SMP worker processes per search; 1 searches in-process
+
+# Replay mode (python Castling_of_the_King_OMEGA7755.py --replay games.pgn)
+replay_games = None  # generator over the games of the PGN file
+replay_game = None  # game on show: {'headers', 'moves' (SAN), 'result'}
+replay_number = 0
+replay_moves = []  # moves converted from SAN so far
+replay_undos = []  # undo records of the moves on the board
+replay_error = None
+analysis_enabled = False
+analysis = None  # (depth, score, best_move, nodes, qsearch_nodes, see_pruned) of the position on show
+
+# Saved games and the autosave journal of the game in progress
+game_start = None  # packed position the moves of move_history were played from
+journal_file = None
+journal_written = 0  # moves of move_history already in the journal
+journal_unsynced = 0  # moves written since the last fsync
+journal_synced_at = 0.0
+resumable_game = None  # (position, player mode, moves) of an unfinished game found at startup
+button_resume = None
+status_message = (None, 0.0)  # (text, time to hide it)
+
+# Position database panel (--db positions.idx, toggled with B)
+position_db = None
+position_db_panel = False
+position_db_cache = (None, [], 0.0)  # (board_hash, moves, lookup milliseconds)
+
 class Piece:
     def __init__(self, piece_type, team):
         self.type = piece_type
@@ -94,12 +139,96 @@ def init_board():
     
     return board
 
+# Zobrist keys. Castling rights get a key each, taken from castling_rights()
+# rather than from the moved flags, so that a king that walked out and back
+# hashes the same as one set up without rights
+zobrist_rng = random.Random(7755)
+ZOBRIST_KEYS = {}
+for piece_type in 'pnbrqk':
+    for team in 'wb':
+        ZOBRIST_KEYS[(piece_type, team)] = [zobrist_rng.getrandbits(64) for _ in range(64)]
+ZOBRIST_BLACK_TO_MOVE = zobrist_rng.getrandbits(64)
+ZOBRIST_CASTLING = {right: zobrist_rng.getrandbits(64) for right in 'KQkq'}
+
+def square_key(row, col):
+    """Return the Zobrist key of whatever stands on a square (0 if empty)"""
+    piece = board[row][col]
+    if not isinstance(piece, Piece):
+        return 0
+    return ZOBRIST_KEYS[(piece.type, piece.team)][row * 8 + col]
+
+def castling_rights():
+    """Return the castling rights as in FEN (KQkq), or '' if none are left"""
+    rights = ''
+    for row, kingside, queenside in [(7, 'K', 'Q'), (0, 'k', 'q')]:
+        king = board[row][4]
+        if isinstance(king, Piece) and king.type == 'k' and not king.has_moved:
+            for right, rook_col in [(kingside, 7), (queenside, 0)]:
+                rook = board[row][rook_col]
+                if isinstance(rook, Piece) and rook.type == 'r' and rook.team == king.team and not rook.has_moved:
+                    rights += right
+    return rights
+
+def castling_key():
+    """Return the Zobrist key of the castling rights left on the board"""
+    h = 0
+    for right in castling_rights():
+        h ^= ZOBRIST_CASTLING[right]
+    return h
+
+def compute_hash():
+    """Compute the Zobrist hash of the current position from scratch"""
+    h = castling_key() ^ (ZOBRIST_BLACK_TO_MOVE if turn == 'b' else 0)
+    for r in range(8):
+        for c in range(8):
+            h ^= square_key(r, c)
+    return h
+
+def refresh_position_state():
+    """Recompute the hash and running evaluation after the board was set up directly.
+
+    The position becomes the start of the repetition history.
+    """
+    global board_hash, eval_mg, eval_eg, eval_phase, history_ply, reversible_plies, halfmove_clock
+    board_hash = compute_hash()
+    eval_mg, eval_eg, eval_phase = compute_eval_terms()
+    history_ply = 0
+    hash_history[0] = board_hash
+    reversible_plies = 0
+    halfmove_clock = 0
+
+# Repetition history: the hash after every move, in a ring buffer indexed by ply
+HASH_HISTORY_SIZE = 1024
+HASH_HISTORY_MASK = HASH_HISTORY_SIZE - 1
+hash_history = [0] * HASH_HISTORY_SIZE
+history_ply = 0  # ply of the current position in hash_history
+reversible_plies = 0  # plies since the last pawn move, capture, castling or loss of castling rights
+halfmove_clock = 0  # plies since the last pawn move or capture, for the fifty-move rule
+
+def repetition_count():
+    """Count earlier occurrences of the current position.
+
+    Only positions with the same side to move since the last irreversible move
+    can match, so the scan stops there; it is cheap enough for every search node.
+    """
+    count = 0
+    ply = history_ply - 2
+    stop = history_ply - min(reversible_plies, HASH_HISTORY_SIZE - 1)
+    while ply >= stop:
+        if hash_history[ply & HASH_HISTORY_MASK] == board_hash:
+            count += 1
+        ply -= 2
+    return count
+
 board = init_board()
 selected_piece = None
 selected_pos = None
 turn = 'w'
 moves_made = 0
 winner = None
+board_hash = compute_hash()
+hash_history[0] = board_hash
+move_history = []
 
 def board_to_screen(row, col):
     return col * SQUARE_SIZE, row * SQUARE_SIZE
@@ -108,12 +237,14 @@ def screen_to_board(pos):
     x, y = pos
     return y // SQUARE_SIZE, x // SQUARE_SIZE
 
-def draw_board():
+def draw_board(screen=None):
+    if screen is None:
+        screen = SCREEN
     for row in range(8):
         for col in range(8):
             color = LIGHT_SQUARE if (row + col) % 2 == 0 else DARK_SQUARE
             x, y = board_to_screen(row, col)
-            pygame.draw.rect(SCREEN, color, (x, y, SQUARE_SIZE, SQUARE_SIZE))
+            pygame.draw.rect(screen, color, (x, y, SQUARE_SIZE, SQUARE_SIZE))
 
 def draw_pieces():
     for row in range(8):
@@ -146,16 +277,78 @@ def get_king_pos(team):
                 return r, c
     return None
 
+KNIGHT_DELTAS = [(-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1)]
+KING_DELTAS = [(-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)]
+ROOK_DIRECTIONS = [(0,1),(0,-1),(1,0),(-1,0)]
+BISHOP_DIRECTIONS = [(1,1),(1,-1),(-1,1),(-1,-1)]
+
 def is_square_attacked(row, col, by_team):
-    for r in range(8):
-        for c in range(8):
-            p = board[r][c]
-            if isinstance(p, Piece) and p.team == by_team:
-                moves, captures = get_legal_moves((r, c), check_king_safety=False)
-                if (row, col) in moves or (row, col) in captures:
+    """Check if a square is attacked by the given team, looking outwards from the square"""
+    # Pawns capture diagonally towards the opponent's side
+    pawn_row = row + 1 if by_team == 'w' else row - 1
+    if 0 <= pawn_row < 8:
+        for dc in [-1, 1]:
+            if 0 <= col + dc < 8:
+                p = board[pawn_row][col + dc]
+                if isinstance(p, Piece) and p.team == by_team and p.type == 'p':
+                    return True
+
+    for deltas, piece_type in [(KNIGHT_DELTAS, 'n'), (KING_DELTAS, 'k')]:
+        for dr, dc in deltas:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                p = board[r][c]
+                if isinstance(p, Piece) and p.team == by_team and p.type == piece_type:
                     return True
+
+    for directions, sliders in [(ROOK_DIRECTIONS, 'rq'), (BISHOP_DIRECTIONS, 'bq')]:
+        for dr, dc in directions:
+            r, c = row + dr, col + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                p = board[r][c]
+                if isinstance(p, Piece):
+                    if p.team == by_team and p.type in sliders:
+                        return True
+                    break
+                r += dr
+                c += dc
     return False
 
+def get_attackers(row, col, by_team, removed=()):
+    """Return the squares of every piece of the given team attacking a square.
+
+    Squares in `removed` count as empty, which exposes pieces lined up behind them.
+    """
+    attackers = []
+    pawn_row = row + 1 if by_team == 'w' else row - 1
+    if 0 <= pawn_row < 8:
+        for dc in [-1, 1]:
+            if 0 <= col + dc < 8 and (pawn_row, col + dc) not in removed:
+                p = board[pawn_row][col + dc]
+                if isinstance(p, Piece) and p.team == by_team and p.type == 'p':
+                    attackers.append((pawn_row, col + dc))
+
+    for deltas, piece_type in [(KNIGHT_DELTAS, 'n'), (KING_DELTAS, 'k')]:
+        for dr, dc in deltas:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8 and (r, c) not in removed:
+                p = board[r][c]
+                if isinstance(p, Piece) and p.team == by_team and p.type == piece_type:
+                    attackers.append((r, c))
+
+    for directions, sliders in [(ROOK_DIRECTIONS, 'rq'), (BISHOP_DIRECTIONS, 'bq')]:
+        for dr, dc in directions:
+            r, c = row + dr, col + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                p = board[r][c]
+                if isinstance(p, Piece) and (r, c) not in removed:
+                    if p.team == by_team and p.type in sliders:
+                        attackers.append((r, c))
+                    break
+                r += dr
+                c += dc
+    return attackers
+
 def is_in_check(team):
     king_pos = get_king_pos(team)
     if not king_pos:
@@ -315,7 +508,7 @@ def has_legal_moves(team):
     return False
 
 def check_game_over():
-    """Check if the game is over (checkmate or stalemate)"""
+    """Check if the game is over (checkmate, stalemate, threefold repetition or fifty-move rule)"""
     global game_state, winner
     
     if not has_legal_moves(turn):
@@ -325,59 +518,1379 @@ def check_game_over():
         else:
             winner = "Stalemate"
         return True
+    if repetition_count() >= 2:
+        game_state = "game_over"
+        winner = "Repetition"
+        return True
+    if halfmove_clock >= 100:
+        game_state = "game_over"
+        winner = "Fifty-move rule"
+        return True
     return False
 
-def make_cpu_move():
-    """Make a random legal move for the CPU (Black)"""
-    global turn, moves_made, cpu_thinking
-    
-    if cpu_thinking:
-        return
-    cpu_thinking = True
-    
-    # Collect all possible moves
+def make_move(move):
+    """Play a move on the board and return the record needed to undo it.
+
+    The hash and the running evaluation are updated from the squares the move
+    touches: out with what stood there before, in with what stands there after.
+    """
+    global turn, moves_made, board_hash, eval_mg, eval_eg, eval_phase
+    global history_ply, reversible_plies, halfmove_clock
+    (row, col), (t_row, t_col) = move
+    piece = board[row][col]
+    captured = board[t_row][t_col]
+    castling = piece.type == 'k' and abs(t_col - col) == 2
+    resets_clock = piece.type == 'p' or isinstance(captured, Piece)
+    # Only an unmoved king or rook moving, or an unmoved rook taken, can cost a castling right
+    rights_change = ((piece.type in 'kr' and not piece.has_moved) or
+                     (isinstance(captured, Piece) and captured.type == 'r' and not captured.has_moved))
+    # No earlier position can come back after these
+    irreversible = resets_clock or castling or (piece.type in 'kr' and not piece.has_moved)
+
+    touched = [(row, col), (t_row, t_col)]
+    if castling:
+        touched += [(row, 7), (row, 5)] if t_col > col else [(row, 0), (row, 3)]
+    undo = (move, piece, captured, piece.has_moved, castling, board_hash, eval_mg, eval_eg, eval_phase,
+            reversible_plies, halfmove_clock)
+
+    h = board_hash ^ ZOBRIST_BLACK_TO_MOVE
+    if rights_change:
+        h ^= castling_key()
+    mg, eg, phase = eval_mg, eval_eg, eval_phase
+    for r, c in touched:
+        h ^= square_key(r, c)
+        p = board[r][c]
+        if isinstance(p, Piece):
+            mg -= MIDGAME_TERMS[(p.type, p.team)][r * 8 + c]
+            eg -= ENDGAME_TERMS[(p.type, p.team)][r * 8 + c]
+            phase -= PHASE_WEIGHTS[p.type]
+
+    if castling:
+        perform_castling((row, col), (t_row, t_col))
+    elif piece.type == 'p' and (t_row == 0 or t_row == 7):
+        # Pawns always promote to a queen
+        new_queen = Piece('q', piece.team)
+        new_queen.has_moved = True
+        board[t_row][t_col] = new_queen
+        board[row][col] = ' '
+    else:
+        board[t_row][t_col] = piece
+        board[row][col] = ' '
+        piece.has_moved = True
+
+    for r, c in touched:
+        h ^= square_key(r, c)
+        p = board[r][c]
+        if isinstance(p, Piece):
+            mg += MIDGAME_TERMS[(p.type, p.team)][r * 8 + c]
+            eg += ENDGAME_TERMS[(p.type, p.team)][r * 8 + c]
+            phase += PHASE_WEIGHTS[p.type]
+    if rights_change:
+        h ^= castling_key()
+    board_hash = h
+    eval_mg, eval_eg, eval_phase = mg, eg, phase
+    history_ply += 1
+    hash_history[history_ply & HASH_HISTORY_MASK] = h
+    reversible_plies = 0 if irreversible else reversible_plies + 1
+    halfmove_clock = 0 if resets_clock else halfmove_clock + 1
+    turn = 'b' if turn == 'w' else 'w'
+    moves_made += 1
+    move_history.append(move)
+    return undo
+
+def unmake_move(undo):
+    """Take back a move played with make_move"""
+    global turn, moves_made, board_hash, eval_mg, eval_eg, eval_phase
+    global history_ply, reversible_plies, halfmove_clock
+    (move, piece, captured, had_moved, castling, board_hash, eval_mg, eval_eg, eval_phase,
+     reversible_plies, halfmove_clock) = undo
+    history_ply -= 1
+    (row, col), (t_row, t_col) = move
+
+    board[row][col] = piece
+    board[t_row][t_col] = captured
+    piece.has_moved = had_moved
+    if castling:
+        if t_col > col:
+            rook = board[row][5]
+            board[row][5] = ' '
+            board[row][7] = rook
+        else:
+            rook = board[row][3]
+            board[row][3] = ' '
+            board[row][0] = rook
+        rook.has_moved = False
+
+    turn = 'b' if turn == 'w' else 'w'
+    moves_made -= 1
+    move_history.pop()
+
+def get_all_legal_moves(team):
+    """Return every legal move for the team as ((row, col), (t_row, t_col)) pairs"""
     possible_moves = []
     for r in range(8):
         for c in range(8):
             piece = board[r][c]
-            if isinstance(piece, Piece) and piece.team == turn:
+            if isinstance(piece, Piece) and piece.team == team:
                 moves, captures = get_legal_moves((r, c))
                 for move in moves + captures:
                     possible_moves.append(((r, c), move))
-    
-    if not possible_moves:
-        cpu_thinking = False
-        check_game_over()
-        return
-    
-    # Choose random move
-    (row, col), (t_row, t_col) = random.choice(possible_moves)
+    return possible_moves
+
+def get_position():
+    """Return a picklable snapshot of the board, side to move, move count and repetition history"""
+    squares = [(p.type, p.team, p.has_moved) if isinstance(p, Piece) else None
+               for row in board for p in row]
+    history = [hash_history[ply & HASH_HISTORY_MASK] for ply in range(history_ply - reversible_plies, history_ply)]
+    return squares, turn, moves_made, history, halfmove_clock
+
+def set_position(position):
+    """Load a snapshot made by get_position"""
+    global board, turn, moves_made, move_history, history_ply, reversible_plies, halfmove_clock
+    squares, turn, moves_made, history, clock = position
+    board = [[' ' for _ in range(8)] for _ in range(8)]
+    for i, square in enumerate(squares):
+        if square:
+            piece = Piece(square[0], square[1])
+            piece.has_moved = square[2]
+            board[i // 8][i % 8] = piece
+    move_history = []
+    refresh_position_state()
+    history = history[-(HASH_HISTORY_SIZE - 1):]
+    for ply, key in enumerate(history):
+        hash_history[ply] = key
+    history_ply = reversible_plies = len(history)
+    hash_history[history_ply] = board_hash
+    halfmove_clock = clock
+
+# Notation. Row 0 is rank 8 and column 0 is the a-file.
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+def square_name(row, col):
+    return 'abcdefgh'[col] + str(8 - row)
+
+def parse_square(name):
+    return 8 - int(name[1]), 'abcdefgh'.index(name[0])
+
+def encode_move(move):
+    """Pack a move into 12 bits (from square << 6 | to square); None packs to 0"""
+    if move is None:
+        return 0
+    (row, col), (t_row, t_col) = move
+    return (row * 8 + col) << 6 | (t_row * 8 + t_col)
+
+def decode_move(code):
+    if not code:
+        return None
+    return (code >> 9, (code >> 6) & 7), ((code >> 3) & 7, code & 7)
+
+def move_to_uci(move):
+    """Return a move in coordinate notation, e.g. e2e4 (promotions always queen)"""
+    (row, col), (t_row, t_col) = move
+    text = square_name(row, col) + square_name(t_row, t_col)
     piece = board[row][col]
+    if isinstance(piece, Piece) and piece.type == 'p' and (t_row == 0 or t_row == 7):
+        text += 'q'
+    return text
 
-    # Handle castling
-    if piece.type == 'k' and abs(t_col - col) == 2:
-        perform_castling((row, col), (t_row, t_col))
+def set_castling_rights(rights):
+    """Mark kings and rooks as unmoved so that exactly the given rights (KQkq) are available"""
+    for row in board:
+        for piece in row:
+            # Only kings and rooks that can still castle count as unmoved
+            if isinstance(piece, Piece) and piece.type in 'kr':
+                piece.has_moved = True
+    for team, row, kingside, queenside in [('w', 7, 'K', 'Q'), ('b', 0, 'k', 'q')]:
+        for right, rook_col in [(kingside, 7), (queenside, 0)]:
+            king, rook = board[row][4], board[row][rook_col]
+            if (right in rights and isinstance(king, Piece) and king.type == 'k' and king.team == team and
+                    isinstance(rook, Piece) and rook.type == 'r' and rook.team == team):
+                king.has_moved = False
+                rook.has_moved = False
+
+def load_fen(fen):
+    """Set up the board from a FEN string. En passant squares are ignored; the rules have no en passant."""
+    global board, turn, moves_made, move_history, halfmove_clock
+    fields = fen.split()
+    placement = fields[0]
+    turn = fields[1] if len(fields) > 1 else 'w'
+    rights = fields[2] if len(fields) > 2 else '-'
+    clock = int(fields[4]) if len(fields) > 4 else 0
+    fullmove = int(fields[5]) if len(fields) > 5 else 1
+
+    board = [[' ' for _ in range(8)] for _ in range(8)]
+    for row, rank in enumerate(placement.split('/')):
+        col = 0
+        for ch in rank:
+            if ch.isdigit():
+                col += int(ch)
+            else:
+                board[row][col] = Piece(ch.lower(), 'w' if ch.isupper() else 'b')
+                col += 1
+    set_castling_rights(rights)
+
+    moves_made = (fullmove - 1) * 2 + (1 if turn == 'b' else 0)
+    move_history = []
+    refresh_position_state()
+    halfmove_clock = clock
+
+def board_to_fen():
+    """Return the current position as a FEN string"""
+    ranks = []
+    for row in range(8):
+        rank = ''
+        empty = 0
+        for col in range(8):
+            piece = board[row][col]
+            if isinstance(piece, Piece):
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece.type.upper() if piece.team == 'w' else piece.type
+            else:
+                empty += 1
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+    return f"{'/'.join(ranks)} {turn} {castling_rights() or '-'} - {halfmove_clock} {moves_made // 2 + 1}"
+
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+def move_from_san(san):
+    """Return the legal move for a SAN string, or None if it is not playable here.
+
+    Underpromotions and en passant are not part of these rules and give None.
+    """
+    san = san.rstrip('+#!?')
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        king_pos = get_king_pos(turn)
+        if not king_pos:
+            return None
+        row, col = king_pos
+        move = (king_pos, (row, col + 2 if len(san) == 3 else col - 2))
+        moves, _ = get_legal_moves(king_pos)
+        return move if move[1] in moves else None
+
+    m = SAN_PATTERN.match(san)
+    if not m:
+        return None
+    piece_type = m.group(1).lower() if m.group(1) else 'p'
+    if m.group(5) and m.group(5) != 'Q':
+        return None
+    target = parse_square(m.group(4))
+    from_col = 'abcdefgh'.index(m.group(2)) if m.group(2) else None
+    from_row = 8 - int(m.group(3)) if m.group(3) else None
+
+    found = None
+    for r in range(8):
+        if from_row is not None and r != from_row:
+            continue
+        for c in range(8):
+            if from_col is not None and c != from_col:
+                continue
+            p = board[r][c]
+            if isinstance(p, Piece) and p.team == turn and p.type == piece_type:
+                moves, captures = get_legal_moves((r, c))
+                if target in moves or target in captures:
+                    if found:
+                        return None  # ambiguous
+                    found = ((r, c), target)
+    return found
+
+PGN_RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+PGN_HEADER = re.compile(r'\[\s*(\w+)\s+"(.*)"\s*\]')
+
+def read_pgn_games(lines):
+    """Yield the games of a PGN stream one at a time as dicts with 'headers', 'moves' (SAN) and 'result'.
+
+    `lines` is any iterable of text lines, such as an open file, so a file of any
+    size is read one game at a time. Comments, variations and NAGs are skipped.
+    """
+    game = {'headers': {}, 'moves': [], 'result': '*'}
+    in_moves = False
+    comment = False  # inside { ... }, which may span lines
+    variation = 0  # depth of ( ... )
+
+    for line in lines:
+        if not comment and line.startswith('['):
+            m = PGN_HEADER.match(line)
+            if m:
+                if in_moves:
+                    yield game
+                    game = {'headers': {}, 'moves': [], 'result': '*'}
+                    in_moves = False
+                game['headers'][m.group(1)] = m.group(2)
+                continue
+        if line.startswith('%'):
+            continue
+
+        token = ''
+        for ch in line + ' ':
+            if comment:
+                if ch == '}':
+                    comment = False
+                continue
+            if ch in '{;()' or ch.isspace():
+                if token and not variation:
+                    in_moves = True
+                    if token in PGN_RESULTS:
+                        game['result'] = token
+                    elif not token.startswith('$'):
+                        game['moves'].append(token)
+                token = ''
+                if ch == '{':
+                    comment = True
+                elif ch == ';':
+                    break
+                elif ch == '(':
+                    variation += 1
+                elif ch == ')':
+                    variation = max(0, variation - 1)
+            elif ch == '.' and token.isdigit():
+                token = ''  # move number such as "12." or "12..."
+            elif ch != '.' or token:
+                token += ch
+
+    if in_moves or game['headers']:
+        yield game
+
+def read_pgn_file(path):
+    """Yield the games of a PGN file one at a time"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        yield from read_pgn_games(f)
+
+# Position database: a sorted file of fixed-size records, one per (position,
+# move) pair, built from PGN games by castling_position_db.py and searched in
+# place through mmap
+POSITION_DB_MAGIC = b'CRSSPDB2'  # 2: castling rights hashed from castling_rights()
+POSITION_DB_HEADER = struct.Struct('<8sQ')  # magic, record count
+POSITION_DB_RECORD = struct.Struct('<QHxxIII')  # position hash, move, white wins, draws, black wins
+
+class PositionDatabase:
+    """Read-only view of a position database file"""
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = POSITION_DB_HEADER.unpack_from(self.data, 0)
+        if magic != POSITION_DB_MAGIC:
+            raise ValueError(f"{path} is not a position database")
+
+    def lookup(self, key):
+        """Return [(move, white_wins, draws, black_wins)] played from a position, most played first"""
+        record = POSITION_DB_RECORD
+        offset = POSITION_DB_HEADER.size
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if record.unpack_from(self.data, offset + mid * record.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        results = []
+        while lo < self.count:
+            h, code, white, draws, black = record.unpack_from(self.data, offset + lo * record.size)
+            if h != key:
+                break
+            results.append((decode_move(code), white, draws, black))
+            lo += 1
+        results.sort(key=lambda r: r[1] + r[2] + r[3], reverse=True)
+        return results
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+# Saved games. A record is a fixed header holding the position the game
+# started from (4 bits per square, side to move and castling rights in a flag
+# byte, the clocks) followed by every move as 2 bytes. The journal uses the
+# same header and grows by one move at a time, so a crash loses at most the
+# move being written; fsync runs in batches to keep moves cheap.
+SAVE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'castling_save.bin')
+JOURNAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'castling_autosave.journal')
+SAVE_MAGIC = b'CRSSSAV1'
+JOURNAL_MAGIC = b'CRSSJNL1'
+SAVE_HEADER = struct.Struct('<8s32sBBHHI')  # 50 bytes: magic, squares, flags, player mode, halfmove clock, moves made, move count
+SAVE_MOVE = struct.Struct('<H')  # encode_move
+SAVE_PIECES = ' pnbrqk'  # 4-bit square codes; Black adds 8
+SAVE_MODES = [None, "1player", "2player"]
+BAD_RECORD_ERRORS = (OSError, struct.error, ValueError, IndexError)  # an unreadable or damaged save or journal
+CASTLING_FLAGS = 'KQkq'  # flag bits 1-4; bit 0 is Black to move
+JOURNAL_SYNC_MOVES = 8
+JOURNAL_SYNC_SECONDS = 2.0
+
+def pack_position():
+    """Return the current position as (squares, flags, halfmove clock, moves made) for SAVE_HEADER"""
+    squares = bytearray(32)
+    for i in range(64):
+        piece = board[i // 8][i % 8]
+        if isinstance(piece, Piece):
+            code = SAVE_PIECES.index(piece.type) | (8 if piece.team == 'b' else 0)
+            squares[i // 2] |= code << (4 * (i % 2))
+    rights = castling_rights()
+    flags = (1 if turn == 'b' else 0) | sum(2 << i for i, right in enumerate(CASTLING_FLAGS) if right in rights)
+    return bytes(squares), flags, halfmove_clock, moves_made
+
+def unpack_position(position):
+    """Set up the board from a position made by pack_position"""
+    global board, turn, moves_made, move_history, halfmove_clock
+    squares, flags, clock, made = position
+    board = [[' ' for _ in range(8)] for _ in range(8)]
+    for i in range(64):
+        code = squares[i // 2] >> (4 * (i % 2)) & 15
+        if code & 7:
+            board[i // 8][i % 8] = Piece(SAVE_PIECES[code & 7], 'b' if code & 8 else 'w')
+    set_castling_rights(''.join(right for i, right in enumerate(CASTLING_FLAGS) if flags & (2 << i)))
+    turn = 'b' if flags & 1 else 'w'
+    moves_made = made
+    move_history = []
+    refresh_position_state()
+    halfmove_clock = clock
+
+def game_record(magic, moves):
+    """Return the header for the game in progress followed by the given moves"""
+    squares, flags, clock, made = game_start
+    header = SAVE_HEADER.pack(magic, squares, flags, SAVE_MODES.index(player_mode), clock, made, len(moves))
+    return header + b''.join(SAVE_MOVE.pack(encode_move(move)) for move in moves)
+
+def read_game_record(path):
+    """Read a save file or journal; return (position, player mode, moves) or None if it is not one"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < SAVE_HEADER.size:
+        return None
+    magic, squares, flags, mode, clock, made, count = SAVE_HEADER.unpack_from(data)
+    if magic not in (SAVE_MAGIC, JOURNAL_MAGIC) or mode >= len(SAVE_MODES):
+        return None
+    # Every square code must name a piece, and each side needs exactly one king
+    codes = [squares[i // 2] >> (4 * (i % 2)) & 15 for i in range(64)]
+    if any(code & 7 == 7 for code in codes) or codes.count(6) != 1 or codes.count(14) != 1:
+        return None
+    if magic == JOURNAL_MAGIC:
+        # Moves run to the end of the file; a torn final write is dropped
+        count = (len(data) - SAVE_HEADER.size) // SAVE_MOVE.size
+    moves = [decode_move(code) for (code,) in
+             SAVE_MOVE.iter_unpack(data[SAVE_HEADER.size:SAVE_HEADER.size + count * SAVE_MOVE.size])]
+    return (squares, flags, clock, made), SAVE_MODES[mode], moves
+
+def restore_game(position, mode, moves):
+    """Set up a recorded game and replay its moves; stops at the first move that is not legal"""
+    global game_start, player_mode
+    reset_game()
+    unpack_position(position)
+    game_start = position
+    player_mode = mode
+    for move in moves:
+        # A damaged code can decode to a row past the board
+        if move is None or move[0][0] > 7:
+            break
+        targets, captures = get_legal_moves(move[0])
+        if move[1] not in targets and move[1] not in captures:
+            break
+        make_move(move)
+
+def save_game(path=SAVE_FILE):
+    """Write the game in progress to a save file, replacing it only once the new one is complete"""
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(game_record(SAVE_MAGIC, move_history))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+def start_journal():
+    """Start journaling the game in progress, with the moves played so far"""
+    global journal_file, journal_written, journal_unsynced, journal_synced_at
+    close_journal()
+    temp = JOURNAL_FILE + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(game_record(JOURNAL_MAGIC, move_history))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, JOURNAL_FILE)
+    # Unbuffered, so every move reaches the OS as soon as it is written
+    journal_file = open(JOURNAL_FILE, 'ab', buffering=0)
+    journal_written = len(move_history)
+    journal_unsynced = 0
+    journal_synced_at = time.time()
+
+def update_journal():
+    """Append the moves played since the last call, syncing every few moves or seconds"""
+    global journal_written, journal_unsynced, journal_synced_at
+    if journal_file is None:
+        return
+    if len(move_history) > journal_written:
+        new_moves = move_history[journal_written:]
+        journal_file.write(b''.join(SAVE_MOVE.pack(encode_move(move)) for move in new_moves))
+        journal_written += len(new_moves)
+        journal_unsynced += len(new_moves)
+    if journal_unsynced and (journal_unsynced >= JOURNAL_SYNC_MOVES or
+                             time.time() - journal_synced_at >= JOURNAL_SYNC_SECONDS):
+        os.fsync(journal_file.fileno())
+        journal_unsynced = 0
+        journal_synced_at = time.time()
+
+def close_journal(remove=False):
+    """Sync and close the journal; remove it once the game no longer needs resuming"""
+    global journal_file
+    if journal_file is not None:
+        update_journal()
+        os.fsync(journal_file.fileno())
+        journal_file.close()
+        journal_file = None
+    if remove and os.path.exists(JOURNAL_FILE):
+        os.remove(JOURNAL_FILE)
+
+def resume_game(record):
+    """Continue a game read by read_game_record and keep journaling it"""
+    global game_state, resumable_game
+    restore_game(*record)
+    game_state = "playing"
+    resumable_game = None
+    start_journal()
+    check_game_over()
+
+def find_resumable_game():
+    """Return the journaled game left by the last session, or None"""
+    if not os.path.exists(JOURNAL_FILE):
+        return None
+    try:
+        return read_game_record(JOURNAL_FILE)
+    except BAD_RECORD_ERRORS:
+        return None
+
+# Evaluation: material plus piece-square bonuses, with separate midgame and
+# endgame values blended by game phase. Tables are written from White's side
+# (row 0 is Black's back rank) and mirrored for Black.
+PIECE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 900, 'k': 0}
+ENDGAME_PIECE_VALUES = {'p': 120, 'n': 300, 'b': 320, 'r': 520, 'q': 920, 'k': 0}
+PHASE_WEIGHTS = {'p': 0, 'n': 1, 'b': 1, 'r': 2, 'q': 4, 'k': 0}
+MAX_PHASE = 24  # phase of the starting position; 0 is a bare endgame
+EVAL_DEBUG = False  # check the running evaluation against a full recompute at every leaf
+MIDGAME_PIECE_SQUARE_TABLES = {
+    'p': [  0,  0,  0,  0,  0,  0,  0,  0,
+           50, 50, 50, 50, 50, 50, 50, 50,
+           10, 10, 20, 30, 30, 20, 10, 10,
+            5,  5, 10, 25, 25, 10,  5,  5,
+            0,  0,  0, 20, 20,  0,  0,  0,
+            5, -5,-10,  0,  0,-10, -5,  5,
+            5, 10, 10,-20,-20, 10, 10,  5,
+            0,  0,  0,  0,  0,  0,  0,  0],
+    'n': [-50,-40,-30,-30,-30,-30,-40,-50,
+          -40,-20,  0,  0,  0,  0,-20,-40,
+          -30,  0, 10, 15, 15, 10,  0,-30,
+          -30,  5, 15, 20, 20, 15,  5,-30,
+          -30,  0, 15, 20, 20, 15,  0,-30,
+          -30,  5, 10, 15, 15, 10,  5,-30,
+          -40,-20,  0,  5,  5,  0,-20,-40,
+          -50,-40,-30,-30,-30,-30,-40,-50],
+    'b': [-20,-10,-10,-10,-10,-10,-10,-20,
+          -10,  0,  0,  0,  0,  0,  0,-10,
+          -10,  0,  5, 10, 10,  5,  0,-10,
+          -10,  5,  5, 10, 10,  5,  5,-10,
+          -10,  0, 10, 10, 10, 10,  0,-10,
+          -10, 10, 10, 10, 10, 10, 10,-10,
+          -10,  5,  0,  0,  0,  0,  5,-10,
+          -20,-10,-10,-10,-10,-10,-10,-20],
+    'r': [  0,  0,  0,  0,  0,  0,  0,  0,
+            5, 10, 10, 10, 10, 10, 10,  5,
+           -5,  0,  0,  0,  0,  0,  0, -5,
+           -5,  0,  0,  0,  0,  0,  0, -5,
+           -5,  0,  0,  0,  0,  0,  0, -5,
+           -5,  0,  0,  0,  0,  0,  0, -5,
+           -5,  0,  0,  0,  0,  0,  0, -5,
+            0,  0,  0,  5,  5,  0,  0,  0],
+    'q': [-20,-10,-10, -5, -5,-10,-10,-20,
+          -10,  0,  0,  0,  0,  0,  0,-10,
+          -10,  0,  5,  5,  5,  5,  0,-10,
+           -5,  0,  5,  5,  5,  5,  0, -5,
+            0,  0,  5,  5,  5,  5,  0, -5,
+          -10,  5,  5,  5,  5,  5,  0,-10,
+          -10,  0,  5,  0,  0,  0,  0,-10,
+          -20,-10,-10, -5, -5,-10,-10,-20],
+    # The king is rewarded for castling into a corner
+    'k': [-30,-40,-40,-50,-50,-40,-40,-30,
+          -30,-40,-40,-50,-50,-40,-40,-30,
+          -30,-40,-40,-50,-50,-40,-40,-30,
+          -30,-40,-40,-50,-50,-40,-40,-30,
+          -20,-30,-30,-40,-40,-30,-30,-20,
+          -10,-20,-20,-20,-20,-20,-20,-10,
+           20, 20,  0,  0,  0,  0, 20, 20,
+           20, 30, 10,  0,  0, 10, 30, 20],
+}
+
+ENDGAME_PIECE_SQUARE_TABLES = dict(MIDGAME_PIECE_SQUARE_TABLES)
+# Passed pawns grow in value and the king walks to the centre
+ENDGAME_PIECE_SQUARE_TABLES['p'] = [
+      0,  0,  0,  0,  0,  0,  0,  0,
+     80, 80, 80, 80, 80, 80, 80, 80,
+     50, 50, 50, 50, 50, 50, 50, 50,
+     30, 30, 30, 30, 30, 30, 30, 30,
+     20, 20, 20, 20, 20, 20, 20, 20,
+     10, 10, 10, 10, 10, 10, 10, 10,
+     10, 10, 10, 10, 10, 10, 10, 10,
+      0,  0,  0,  0,  0,  0,  0,  0]
+ENDGAME_PIECE_SQUARE_TABLES['k'] = [
+    -50,-40,-30,-20,-20,-30,-40,-50,
+    -30,-20,-10,  0,  0,-10,-20,-30,
+    -30,-10, 20, 30, 30, 20,-10,-30,
+    -30,-10, 30, 40, 40, 30,-10,-30,
+    -30,-10, 30, 40, 40, 30,-10,-30,
+    -30,-10, 20, 30, 30, 20,-10,-30,
+    -30,-30,  0,  0,  0,  0,-30,-30,
+    -50,-30,-30,-30,-30,-30,-30,-50]
+
+# Tuned weights written by castling_tune.py, loaded at startup when present
+EVAL_WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'castling_eval_weights.json')
+
+# Per piece and square: signed (White positive) material plus piece-square value
+MIDGAME_TERMS = {}
+ENDGAME_TERMS = {}
+
+def build_eval_tables():
+    """Fold piece values and piece-square tables into MIDGAME_TERMS and ENDGAME_TERMS"""
+    for piece_type in 'pnbrqk':
+        for team in 'wb':
+            sign = 1 if team == 'w' else -1
+            mirror = [r * 8 + c if team == 'w' else (7 - r) * 8 + c for r in range(8) for c in range(8)]
+            MIDGAME_TERMS[(piece_type, team)] = [
+                sign * (PIECE_VALUES[piece_type] + MIDGAME_PIECE_SQUARE_TABLES[piece_type][i]) for i in mirror]
+            ENDGAME_TERMS[(piece_type, team)] = [
+                sign * (ENDGAME_PIECE_VALUES[piece_type] + ENDGAME_PIECE_SQUARE_TABLES[piece_type][i]) for i in mirror]
+
+def load_eval_weights(path):
+    """Replace the piece values and piece-square tables with those of a weight file.
+
+    Call refresh_position_state() afterwards if a game is already set up.
+    """
+    with open(path) as f:
+        weights = json.load(f)
+    for key in ('midgame_piece_square_tables', 'endgame_piece_square_tables'):
+        if any(len(table) != 64 for table in weights[key].values()):
+            raise ValueError(f"{path}: piece-square tables need 64 entries")
+    PIECE_VALUES.update(weights['piece_values'])
+    ENDGAME_PIECE_VALUES.update(weights['endgame_piece_values'])
+    MIDGAME_PIECE_SQUARE_TABLES.update(weights['midgame_piece_square_tables'])
+    ENDGAME_PIECE_SQUARE_TABLES.update(weights['endgame_piece_square_tables'])
+    build_eval_tables()
+
+def compute_eval_terms():
+    """Return (midgame, endgame, phase) totals for the whole board, scanning every square"""
+    mg = eg = phase = 0
+    for r in range(8):
+        for c in range(8):
+            p = board[r][c]
+            if isinstance(p, Piece):
+                mg += MIDGAME_TERMS[(p.type, p.team)][r * 8 + c]
+                eg += ENDGAME_TERMS[(p.type, p.team)][r * 8 + c]
+                phase += PHASE_WEIGHTS[p.type]
+    return mg, eg, phase
+
+def evaluate():
+    """Score the position in centipawns from the side to move's point of view.
+
+    Uses the running totals kept by make_move, so this does not look at the board.
+    """
+    if EVAL_DEBUG and (eval_mg, eval_eg, eval_phase) != compute_eval_terms():
+        raise AssertionError(f"running evaluation {(eval_mg, eval_eg, eval_phase)} != "
+                             f"recomputed {compute_eval_terms()} in {board_to_fen()}")
+    phase = min(eval_phase, MAX_PHASE)
+    score = (eval_mg * phase + eval_eg * (MAX_PHASE - phase)) // MAX_PHASE
+    return score if turn == 'w' else -score
+
+build_eval_tables()
+if os.path.exists(EVAL_WEIGHTS_FILE):
+    load_eval_weights(EVAL_WEIGHTS_FILE)
+eval_mg, eval_eg, eval_phase = compute_eval_terms()
+
+# Search state. The transposition table, killer moves and history scores are
+# kept between searches so each move (and each ponder) builds on the last one.
+MATE_SCORE = 100000
+MAX_PLY = 128
+MAX_SEARCH_DEPTH = 64
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+TT_MAX_ENTRIES = 1000000
+transposition_table = {}
+killer_moves = [[None, None] for _ in range(MAX_PLY)]
+history_scores = {}
+search_nodes = 0
+qsearch_nodes = 0  # nodes searched by quiescence
+see_pruned = 0  # quiescence captures skipped because they lose material by static exchange
+search_deadline = None  # time.time() value to stop at, None to search until stopped
+search_soft_deadline = None  # no new depth is started after this time
+search_node_limit = None
+search_stopped = False
+search_poll = None  # called periodically during a search, e.g. to read engine messages
+root_best_move = None  # best move of the last completed root search
+search_worker_id = 0  # Lazy SMP helpers (id > 0) vary their root move order
+
+# Lazy SMP: worker processes all search the same root and share one table
+TT_SHARED_SLOTS = 1 << 20
+smp_workers = []
+smp_tasks = []
+smp_results = None
+smp_stop = None
+smp_table = None
+
+class SharedTranspositionTable:
+    """Fixed-size transposition table in shared memory, used by every search process.
+
+    Each slot is two 64-bit words: the position key XORed with the packed entry,
+    then the packed entry itself. A slot torn by two processes writing at once
+    fails the key check rather than returning a wrong entry, so no locks are needed.
+    """
+    def __init__(self, slots=TT_SHARED_SLOTS, array=None):
+        self.slots = slots
+        self.array = array if array is not None else multiprocessing.RawArray('Q', slots * 2)
+
+    def get(self, key):
+        i = (key & (self.slots - 1)) * 2
+        data = self.array[i + 1]
+        if self.array[i] ^ data != key:
+            return None
+        score = data >> 32
+        if score >= 1 << 31:
+            score -= 1 << 32
+        return (data >> 8) & 0xFF, score, data & 0xFF, decode_move((data >> 16) & 0xFFFF)
+
+    def __setitem__(self, key, entry):
+        depth, score, flag, move = entry
+        data = (score & 0xFFFFFFFF) << 32 | encode_move(move) << 16 | (depth & 0xFF) << 8 | flag
+        i = (key & (self.slots - 1)) * 2
+        self.array[i] = key ^ data
+        self.array[i + 1] = data
+
+    def clear(self):
+        ctypes.memset(self.array, 0, ctypes.sizeof(self.array))
+
+def start_search_clock(time_limit=None, soft_time_limit=None, node_limit=None):
+    """Reset the node counters and limits at the start of a search"""
+    global search_nodes, qsearch_nodes, see_pruned, search_stopped
+    global search_deadline, search_soft_deadline, search_node_limit
+    now = time.time()
+    search_nodes = qsearch_nodes = see_pruned = 0
+    search_stopped = False
+    search_deadline = now + time_limit if time_limit is not None else None
+    search_soft_deadline = now + soft_time_limit if soft_time_limit is not None else None
+    search_node_limit = node_limit
+
+def check_search_limits():
+    """Stop the search when its deadline or node limit passes, after giving search_poll a chance to run"""
+    global search_stopped
+    if search_poll is not None:
+        search_poll()
+    if search_deadline is not None and time.time() >= search_deadline:
+        search_stopped = True
+    if search_node_limit is not None and search_nodes >= search_node_limit:
+        search_stopped = True
+
+def out_of_soft_time():
+    return search_soft_deadline is not None and time.time() >= search_soft_deadline
+
+def clear_search_state():
+    """Forget everything learned in earlier searches (new game)"""
+    transposition_table.clear()
+    history_scores.clear()
+    for killers in killer_moves:
+        killers[0] = killers[1] = None
+
+def order_moves(moves, tt_move, ply):
+    """Sort moves: hash move, then captures by MVV-LVA, killers, and quiet moves by history"""
+    killers = killer_moves[ply]
+
+    def move_score(move):
+        if move == tt_move:
+            return 1000000000
+        (row, col), (t_row, t_col) = move
+        target = board[t_row][t_col]
+        if isinstance(target, Piece):
+            return 100000000 + PIECE_VALUES[target.type] * 10 - PIECE_VALUES[board[row][col].type] // 10
+        if move in killers:
+            return 10000000
+        return history_scores.get(move, 0)
+
+    return sorted(moves, key=move_score, reverse=True)
+
+def score_to_tt(score, ply):
+    """Store mate scores relative to the current node rather than the root"""
+    if score > MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score < -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score > MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score < -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
+# Static exchange evaluation values; a king may only capture last
+SEE_VALUES = {'p': 100, 'n': 320, 'b': 330, 'r': 500, 'q': 900, 'k': 20000}
+
+def static_exchange(move):
+    """Return the material a capture wins once both sides have traded off on the target square.
+
+    Works from the attackers of the square (see get_attackers) with the swap-list
+    method, without playing any move. Pins are not considered.
+    """
+    (row, col), (t_row, t_col) = move
+    target = board[t_row][t_col]
+    attacker = board[row][col]
+    gain = [SEE_VALUES[target.type] if isinstance(target, Piece) else 0]
+    attacker_value = SEE_VALUES[attacker.type]
+    if attacker.type == 'p' and (t_row == 0 or t_row == 7):
+        # The piece left standing on the square is the new queen
+        gain[0] += SEE_VALUES['q'] - SEE_VALUES['p']
+        attacker_value = SEE_VALUES['q']
+    removed = {(row, col)}
+    side = 'b' if attacker.team == 'w' else 'w'
+    while True:
+        gain.append(attacker_value - gain[-1])
+        if max(-gain[-2], gain[-1]) < 0:
+            break
+        attackers = get_attackers(t_row, t_col, side, removed)
+        if not attackers:
+            break
+        square = min(attackers, key=lambda sq: SEE_VALUES[board[sq[0]][sq[1]].type])
+        removed.add(square)
+        attacker_value = SEE_VALUES[board[square[0]][square[1]].type]
+        side = 'b' if side == 'w' else 'w'
+    # The last entry is a capture nobody can make; fold the rest back to the root
+    for d in range(len(gain) - 2, 0, -1):
+        gain[d - 1] = -max(-gain[d - 1], gain[d])
+    return gain[0]
+
+def get_noisy_moves(team):
+    """Return the pseudo-legal captures and promotions of a team"""
+    noisy = []
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if isinstance(piece, Piece) and piece.team == team:
+                moves, captures = get_legal_moves((r, c), check_king_safety=False)
+                for move in captures:
+                    noisy.append(((r, c), move))
+                if piece.type == 'p':
+                    for move in moves:
+                        if move[0] == 0 or move[0] == 7:
+                            noisy.append(((r, c), move))
+    return noisy
+
+def quiescence(alpha, beta, ply):
+    """Search captures and promotions until the position is quiet.
+
+    Captures that lose material by static exchange are skipped unsearched;
+    see_pruned counts them. In check, every evasion is searched instead.
+    """
+    global search_nodes, qsearch_nodes, see_pruned
+    search_nodes += 1
+    qsearch_nodes += 1
+    if search_nodes & 31 == 0:
+        check_search_limits()
+    if search_stopped:
+        return 0
+
+    if is_in_check(turn):
+        moves = get_all_legal_moves(turn)
+        if not moves:
+            return -MATE_SCORE + ply
+        best_score = -MATE_SCORE - 1
+        for move in order_moves(moves, None, min(ply, MAX_PLY - 1)):
+            undo = make_move(move)
+            score = -quiescence(-beta, -alpha, ply + 1)
+            unmake_move(undo)
+            if search_stopped:
+                return 0
+            if score > best_score:
+                best_score = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+        return best_score
+
+    stand_pat = evaluate()
+    if stand_pat >= beta or ply >= MAX_PLY - 1:
+        return stand_pat
+    if stand_pat > alpha:
+        alpha = stand_pat
+
+    scored = []
+    for move in get_noisy_moves(turn):
+        exchange = static_exchange(move)
+        if exchange < 0:
+            see_pruned += 1
+            continue
+        scored.append((exchange, move))
+    scored.sort(key=lambda item: item[0], reverse=True)
+
+    best_score = stand_pat
+    mover = turn
+    for _, move in scored:
+        undo = make_move(move)
+        if is_in_check(mover):
+            unmake_move(undo)
+            continue
+        score = -quiescence(-beta, -alpha, ply + 1)
+        unmake_move(undo)
+        if search_stopped:
+            return 0
+        if score > best_score:
+            best_score = score
+        if score > alpha:
+            alpha = score
+        if alpha >= beta:
+            break
+    return best_score
+
+def negamax(depth, alpha, beta, ply):
+    """Alpha-beta search of the current position; returns a score for the side to move"""
+    global search_nodes, root_best_move
+    search_nodes += 1
+    if search_nodes & 31 == 0:
+        check_search_limits()
+    if search_stopped:
+        return 0
+
+    # Inside the tree a single repetition is already a draw: whoever could
+    # avoid it did not
+    if ply > 0 and (halfmove_clock >= 100 or repetition_count()):
+        return 0
+
+    alpha_orig = alpha
+    tt_move = None
+    entry = transposition_table.get(board_hash)
+    if entry:
+        e_depth, e_score, e_flag, tt_move = entry
+        if ply > 0 and e_depth >= depth:
+            e_score = score_from_tt(e_score, ply)
+            if e_flag == TT_EXACT:
+                return e_score
+            if e_flag == TT_LOWER:
+                alpha = max(alpha, e_score)
+            else:
+                beta = min(beta, e_score)
+            if alpha >= beta:
+                return e_score
+
+    if depth <= 0:
+        return quiescence(alpha, beta, ply)
+
+    moves = get_all_legal_moves(turn)
+    if not moves:
+        return -MATE_SCORE + ply if is_in_check(turn) else 0
+
+    moves = order_moves(moves, tt_move, ply)
+    if ply == 0 and search_worker_id:
+        # Helpers start from a different move after the hash move so the
+        # processes spread over the tree instead of repeating each other
+        shift = search_worker_id % max(1, len(moves) - 1)
+        moves = moves[:1] + moves[1 + shift:] + moves[1:1 + shift]
+
+    best_score = -MATE_SCORE - 1
+    best_move = None
+    for move in moves:
+        quiet = board[move[1][0]][move[1][1]] == ' '
+        undo = make_move(move)
+        score = -negamax(depth - 1, -beta, -alpha, ply + 1)
+        unmake_move(undo)
+        if search_stopped:
+            return 0
+
+        if score > best_score:
+            best_score = score
+            best_move = move
+        if score > alpha:
+            alpha = score
+        if alpha >= beta:
+            if quiet:
+                if killer_moves[ply][0] != move:
+                    killer_moves[ply][1] = killer_moves[ply][0]
+                    killer_moves[ply][0] = move
+                history_scores[move] = history_scores.get(move, 0) + depth * depth
+            break
+
+    if best_score <= alpha_orig:
+        flag = TT_UPPER
+    elif best_score >= beta:
+        flag = TT_LOWER
     else:
-        # Handle pawn promotion
-        if piece.type == 'p' and (t_row == 0 or t_row == 7):
-            new_queen = Piece(piece.team, 'q')
-            new_queen.has_moved = True
-            board[t_row][t_col] = new_queen
-            board[row][col] = ' '
-        else:
-            board[t_row][t_col] = piece
-            board[row][col] = ' '
-            piece.has_moved = True
+        flag = TT_EXACT
+    transposition_table[board_hash] = (depth, score_to_tt(best_score, ply), flag, best_move)
+    if ply == 0:
+        root_best_move = best_move
+    return best_score
 
-    turn = 'w' if turn == 'b' else 'b'
-    moves_made += 1
+def principal_variation(move, max_length=MAX_SEARCH_DEPTH):
+    """Return the expected line starting with a move, following hash moves"""
+    line = [move]
+    undos = [make_move(move)]
+    seen = {board_hash}
+    while len(line) < max_length:
+        entry = transposition_table.get(board_hash)
+        if not entry or entry[3] is None or entry[3] not in get_all_legal_moves(turn):
+            break
+        line.append(entry[3])
+        undos.append(make_move(entry[3]))
+        if board_hash in seen:
+            break
+        seen.add(board_hash)
+    for undo in reversed(undos):
+        unmake_move(undo)
+    return line
+
+def predicted_reply(move):
+    """Return the opponent's expected answer to a move, taken from the transposition table"""
+    undo = make_move(move)
+    reply = None
+    entry = transposition_table.get(board_hash)
+    if entry and entry[3] in get_all_legal_moves(turn):
+        reply = entry[3]
+    unmake_move(undo)
+    return reply
+
+def iterative_deepening(time_limit=None, max_depth=MAX_SEARCH_DEPTH, start_depth=1, report=None,
+                        soft_time_limit=None, node_limit=None):
+    """Search depth after depth until the time limit, depth limit or a stop request.
+
+    No new depth is started once soft_time_limit has passed. report(depth, score,
+    move) is called after each completed depth. Returns the best move of the
+    deepest completed depth, or None if none completed.
+    """
+    start_search_clock(time_limit, soft_time_limit, node_limit)
+    if isinstance(transposition_table, dict) and len(transposition_table) > TT_MAX_ENTRIES:
+        transposition_table.clear()
+    for move in history_scores:
+        history_scores[move] //= 2
+
+    best_move = None
+    for depth in range(start_depth, max_depth + 1):
+        score = negamax(depth, -MATE_SCORE - 1, MATE_SCORE + 1, 0)
+        if search_stopped:
+            break
+        best_move = root_best_move
+        if report is not None:
+            report(depth, score, best_move)
+        if abs(score) > MATE_SCORE - MAX_PLY or out_of_soft_time():
+            break
+    return best_move
+
+def search_best_move(time_limit=None, max_depth=MAX_SEARCH_DEPTH, processes=None, report=None,
+                     soft_time_limit=None, node_limit=None):
+    """Find the best move for the side to move, in parallel if processes > 1.
+
+    The limits and report work as for iterative_deepening. Returns
+    (best_move, predicted_reply).
+    """
+    moves = get_all_legal_moves(turn)
+    if not moves:
+        return None, None
+
+    if (processes or SEARCH_PROCESSES) > 1:
+        best_move = parallel_search(time_limit, max_depth, processes or SEARCH_PROCESSES, report,
+                                    soft_time_limit, node_limit)
+    else:
+        best_move = iterative_deepening(time_limit, max_depth, report=report,
+                                        soft_time_limit=soft_time_limit, node_limit=node_limit)
+
+    if best_move is None:
+        # Not even depth 1 finished; fall back to the best ordered move
+        entry = transposition_table.get(board_hash)
+        best_move = order_moves(moves, entry[3] if entry else None, 0)[0]
+    return best_move, predicted_reply(best_move)
+
+def reset_child_signals():
+    """Make a forked helper process stoppable again.
+
+    SDL catches SIGTERM in every process that ran pygame.init(), and the
+    children inherit that; restore the default so the parent can terminate
+    them, and ignore Ctrl+C so it is left to the parent. Also used as the
+    initializer of the tools' process pools.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def search_worker(worker_id, table_array, tasks, results, stop_event):
+    """Lazy SMP worker: search each root it is sent, reporting every completed depth"""
+    global transposition_table, search_poll, search_worker_id
+    reset_child_signals()
+    transposition_table = SharedTranspositionTable(array=table_array)
+    search_worker_id = worker_id
+
+    def poll():
+        global search_stopped
+        if stop_event.is_set():
+            search_stopped = True
+
+    search_poll = poll
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        position, max_depth, node_limit = task
+        set_position(position)
+        # Odd workers skip a depth so the processes are not all on the same iteration
+        iterative_deepening(None, max_depth, start_depth=1 + worker_id % 2,
+                            report=lambda depth, score, move: results.put((worker_id, depth, score, move, search_nodes)),
+                            node_limit=node_limit)
+        results.put((worker_id, None, None, None, search_nodes))
+
+def start_search_workers(processes):
+    """Start the Lazy SMP worker processes and the shared table they use"""
+    global smp_results, smp_stop, smp_table, transposition_table
+    if len(smp_workers) == processes:
+        return
+    stop_search_workers()
+    if smp_table is None:
+        smp_table = SharedTranspositionTable()
+    transposition_table = smp_table
+    smp_results = multiprocessing.Queue()
+    smp_stop = multiprocessing.Event()
+    for worker_id in range(processes):
+        tasks = multiprocessing.Queue()
+        worker = multiprocessing.Process(target=search_worker, daemon=True,
+                                         args=(worker_id, smp_table.array, tasks, smp_results, smp_stop))
+        worker.start()
+        smp_tasks.append(tasks)
+        smp_workers.append(worker)
+
+def stop_search_workers():
+    """Shut down the Lazy SMP worker processes"""
+    for tasks in smp_tasks:
+        tasks.put(None)
+    for worker in smp_workers:
+        worker.join(timeout=2)
+    smp_tasks.clear()
+    smp_workers.clear()
+
+atexit.register(stop_search_workers)
+
+def parallel_search(time_limit=None, max_depth=MAX_SEARCH_DEPTH, processes=None, report=None,
+                    soft_time_limit=None, node_limit=None):
+    """Lazy SMP: every worker searches the current position; keep the deepest completed result.
+
+    search_nodes is the total of the nodes the workers last reported. A node
+    limit is shared out evenly, each worker stopping at its own part.
+    """
+    global search_nodes
+    start_search_workers(processes or SEARCH_PROCESSES)
+    start_search_clock(time_limit, soft_time_limit, node_limit)
+    smp_stop.clear()
+    position = get_position()
+    worker_limit = max(1, node_limit // len(smp_tasks)) if node_limit is not None else None
+    for tasks in smp_tasks:
+        tasks.put((position, max_depth, worker_limit))
+
+    best_depth = 0
+    best_move = None
+    worker_nodes = {}
+    running = len(smp_workers)
+    while running:
+        try:
+            worker_id, depth, score, move, nodes = smp_results.get(timeout=0.005)
+            worker_nodes[worker_id] = nodes
+            search_nodes = sum(worker_nodes.values())
+        except queue.Empty:
+            depth = -1
+        if depth is None:
+            running -= 1
+        elif depth > best_depth:
+            best_depth = depth
+            best_move = move
+            if report is not None:
+                report(depth, score, move)
+            if depth >= max_depth or abs(score) > MATE_SCORE - MAX_PLY or out_of_soft_time():
+                smp_stop.set()
+        check_search_limits()
+        if search_stopped:
+            smp_stop.set()
+    return best_move
+
+def make_cpu_move(move=None):
+    """Play a move for the CPU (Black), searching for one if none is given"""
+    global cpu_thinking
+
+    if cpu_thinking:
+        return
+    cpu_thinking = True
+
+    if move is None:
+        move, _ = search_best_move(CPU_THINK_TIME)
+
+    if move is None:
+        cpu_thinking = False
+        check_game_over()
+        return
+
+    make_move(move)
     cpu_thinking = False
-    
+
     check_game_over()
 
+def engine_loop(conn, processes=1):
+    """Serve CPU move and ponder requests from the game in a separate process.
+
+    Messages from the game:
+      ('go', search_id, position, time_limit)      search and answer with a bestmove
+      ('ponder', search_id, position, predicted)   search the position after the predicted
+                                                   human move until told otherwise
+      ('ponderhit', search_id, time_limit)         the human played the predicted move;
+                                                   finish the ponder search as a 'go'
+      ('analyse', search_id, position)             search until told otherwise, sending
+                                                   ('info', search_id, depth, score, move, nodes,
+                                                   quiescence nodes, SEE-pruned captures)
+                                                   after every completed depth
+      ('stop',)                                    abandon the current search
+      ('quit',)
+    Answers are ('bestmove', search_id, move, predicted_reply). Searches use
+    `processes` Lazy SMP processes.
+    """
+    global search_poll, SEARCH_PROCESSES
+    SEARCH_PROCESSES = processes
+    reset_child_signals()
+    # Lazy SMP workers the game itself may have started belong to the game
+    smp_workers.clear()
+    smp_tasks.clear()
+    pending = []
+    ponder = {'active': False, 'search_id': None}
+
+    def poll():
+        global search_deadline, search_stopped
+        while conn.poll():
+            msg = conn.recv()
+            if msg[0] == 'ponderhit' and ponder['active']:
+                ponder['active'] = False
+                ponder['search_id'] = msg[1]
+                search_deadline = time.time() + msg[2]
+            else:
+                # Anything else cancels the search and is handled afterwards
+                pending.append(msg)
+                search_stopped = True
+                return
+
+    search_poll = poll
+    while True:
+        try:
+            msg = pending.pop(0) if pending else conn.recv()
+        except EOFError:
+            # The game went away without saying goodbye
+            break
+        kind = msg[0]
+        if kind == 'quit':
+            break
+
+        if kind == 'go':
+            _, search_id, position, time_limit = msg
+            set_position(position)
+            move, reply = search_best_move(time_limit)
+            if not pending:
+                conn.send(('bestmove', search_id, move, reply))
+
+        elif kind == 'analyse':
+            _, search_id, position = msg
+            set_position(position)
+            iterative_deepening(report=lambda depth, score, move: conn.send(
+                ('info', search_id, depth, score, move, search_nodes, qsearch_nodes, see_pruned)))
+
+        elif kind == 'ponder':
+            _, search_id, position, predicted = msg
+            set_position(position)
+            if predicted not in get_all_legal_moves(turn):
+                continue
+            make_move(predicted)
+            ponder['active'] = True
+            move, reply = search_best_move(None)
+            # A finished ponder search (e.g. a forced mate) waits for the verdict
+            while ponder['active'] and not pending:
+                poll()
+                time.sleep(0.01)
+            if not ponder['active'] and not pending:
+                conn.send(('bestmove', ponder['search_id'], move, reply))
+            ponder['active'] = False
+
+    stop_search_workers()
+
+def start_engine():
+    """Start the background engine process"""
+    global engine_process, engine_conn
+    engine_conn, child_conn = multiprocessing.Pipe()
+    # A spawned child re-imports this module; keep it from opening a window
+    video_driver = os.environ.get('SDL_VIDEODRIVER')
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    # Not a daemon, so that it may start Lazy SMP workers of its own
+    engine_process = multiprocessing.Process(target=engine_loop, args=(child_conn, SEARCH_PROCESSES))
+    engine_process.start()
+    child_conn.close()
+    atexit.register(stop_engine)
+    if video_driver is None:
+        del os.environ['SDL_VIDEODRIVER']
+    else:
+        os.environ['SDL_VIDEODRIVER'] = video_driver
+
+def stop_engine():
+    """Shut down the background engine process"""
+    global engine_process, engine_conn
+    if engine_process is None:
+        return
+    engine_conn.send(('quit',))
+    engine_process.join(timeout=2)
+    if engine_process.is_alive():
+        engine_process.terminate()
+    engine_process = None
+    engine_conn = None
+
+def request_cpu_move(human_move=None):
+    """Ask the engine for Black's move, reusing the ponder search if the human played the predicted move"""
+    global engine_search_id, ponder_move, cpu_thinking
+    if engine_process is None:
+        start_engine()
+    engine_search_id += 1
+    if ponder_move is not None and human_move == ponder_move:
+        engine_conn.send(('ponderhit', engine_search_id, CPU_THINK_TIME))
+    else:
+        if ponder_move is not None:
+            engine_conn.send(('stop',))
+        engine_conn.send(('go', engine_search_id, get_position(), CPU_THINK_TIME))
+    ponder_move = None
+    cpu_thinking = True
+
+def poll_engine():
+    """Return (move, predicted_reply) once the engine has answered the current request, else None.
+
+    Analysis updates for the current request are stored in `analysis`.
+    """
+    global analysis
+    while engine_conn is not None and engine_conn.poll():
+        msg = engine_conn.recv()
+        if msg[1] != engine_search_id:
+            continue
+        if msg[0] == 'bestmove':
+            return msg[2], msg[3]
+        if msg[0] == 'info':
+            analysis = msg[2:]
+    return None
+
+def start_pondering(predicted):
+    """Let the engine search the expected human reply while White is thinking"""
+    global engine_search_id, ponder_move
+    if engine_process is None or predicted is None:
+        return
+    engine_search_id += 1
+    engine_conn.send(('ponder', engine_search_id, get_position(), predicted))
+    ponder_move = predicted
+
+def cancel_engine_search():
+    """Abandon any running search or ponder; late answers are ignored"""
+    global engine_search_id, ponder_move
+    if engine_process is not None:
+        engine_conn.send(('stop',))
+    engine_search_id += 1
+    ponder_move = None
+
 def draw_startup_screen():
     """Draw the startup screen"""
-    global button_1p, button_2p
+    global button_1p, button_2p, button_resume
     
     SCREEN.fill((30, 30, 40))
     
@@ -417,6 +1930,15 @@ def draw_startup_screen():
     SCREEN.blit(text_1p, text_1p_rect)
     SCREEN.blit(text_2p, text_2p_rect)
 
+    # Resume the game the last session left unfinished
+    button_resume = None
+    if resumable_game:
+        button_resume = pygame.Rect(WIDTH//2 - 150, HEIGHT//2 + 200, 300, 60)
+        pygame.draw.rect(SCREEN, (70, 150, 90), button_resume, border_radius=10)
+        pygame.draw.rect(SCREEN, WHITE, button_resume, 3, border_radius=10)
+        text_resume = button_font.render(f"RESUME ({len(resumable_game[2])} moves)", True, WHITE)
+        SCREEN.blit(text_resume, text_resume.get_rect(center=button_resume.center))
+
 def draw_game_over_screen():
     """Draw the game over screen"""
     global back_button
@@ -431,6 +1953,12 @@ def draw_game_over_screen():
     if winner == "Stalemate":
         title_text = "STALEMATE!"
         color = (200, 200, 200)
+    elif winner in ("Repetition", "Fifty-move rule"):
+        title_text = "DRAW!"
+        color = (200, 200, 200)
+        reason_font = pygame.font.SysFont('Arial', 28)
+        reason = reason_font.render(f"by {winner.lower()}", True, color)
+        SCREEN.blit(reason, reason.get_rect(center=(WIDTH//2, HEIGHT//2 - 30)))
     else:
         title_text = f"{winner} Wins!"
         color = (255, 215, 0)
@@ -450,9 +1978,180 @@ def draw_game_over_screen():
     text_back_rect = text_back.get_rect(center=back_button.center)
     SCREEN.blit(text_back, text_back_rect)
 
+def start_replay(path):
+    """Open a PGN file and show its first game"""
+    global replay_games, replay_number, game_state
+    replay_games = read_pgn_file(path)
+    replay_number = 0
+    game_state = "replay"
+    next_replay_game()
+
+def next_replay_game():
+    """Load the next game of the PGN stream; returns False at the end of the file"""
+    global replay_game, replay_number, replay_moves, replay_undos, replay_error, analysis
+    game = next(replay_games, None)
+    if game is None:
+        return False
+    reset_game()
+    if 'FEN' in game['headers']:
+        load_fen(game['headers']['FEN'])
+    replay_game = game
+    replay_number += 1
+    replay_moves = []
+    replay_undos = []
+    replay_error = None
+    analysis = None
+    request_analysis()
+    return True
+
+def replay_step_forward():
+    """Play the next move of the game; SAN is converted only when first reached"""
+    global replay_error
+    index = len(replay_undos)
+    if index >= len(replay_game['moves']) or replay_error:
+        return False
+    if index == len(replay_moves):
+        move = move_from_san(replay_game['moves'][index])
+        if move is None:
+            replay_error = f"Move {replay_game['moves'][index]} is not playable here"
+            return False
+        replay_moves.append(move)
+    replay_undos.append(make_move(replay_moves[index]))
+    return True
+
+def replay_step_back():
+    global replay_error
+    if not replay_undos:
+        return False
+    unmake_move(replay_undos.pop())
+    replay_error = None
+    return True
+
+def handle_replay_key(key):
+    """Keyboard controls for replay mode"""
+    global game_state, analysis_enabled, analysis
+    position = len(replay_undos)
+    if key == pygame.K_RIGHT:
+        replay_step_forward()
+    elif key == pygame.K_LEFT:
+        replay_step_back()
+    elif key == pygame.K_HOME:
+        while replay_step_back():
+            pass
+    elif key == pygame.K_END:
+        while replay_step_forward():
+            pass
+    elif key in (pygame.K_n, pygame.K_DOWN, pygame.K_PAGEDOWN):
+        next_replay_game()
+        return
+    elif key == pygame.K_e:
+        analysis_enabled = not analysis_enabled
+        analysis = None
+        if analysis_enabled:
+            request_analysis()
+        else:
+            cancel_engine_search()
+        return
+    elif key == pygame.K_ESCAPE:
+        game_state = "menu"
+        reset_game()
+        return
+    if len(replay_undos) != position:
+        analysis = None
+        request_analysis()
+
+def request_analysis():
+    """Have the engine analyse the shown position in the background"""
+    global engine_search_id
+    if not analysis_enabled:
+        return
+    if engine_process is None:
+        start_engine()
+    engine_search_id += 1
+    engine_conn.send(('analyse', engine_search_id, get_position()))
+
+def draw_replay_info():
+    """Draw the game, move and engine lines over the board in replay mode"""
+    strip = pygame.Surface((WIDTH, 56), pygame.SRCALPHA)
+    strip.fill((0, 0, 0, 160))
+    SCREEN.blit(strip, (0, 0))
+    strip = pygame.Surface((WIDTH, 80), pygame.SRCALPHA)
+    strip.fill((0, 0, 0, 160))
+    SCREEN.blit(strip, (0, HEIGHT - 80))
+
+    headers = replay_game['headers']
+    font = pygame.font.SysFont('Arial', 22, bold=True)
+    title = f"{headers.get('White', '?')} - {headers.get('Black', '?')}  {replay_game['result']}"
+    SCREEN.blit(font.render(title, True, WHITE), (10, 4))
+
+    small_font = pygame.font.SysFont('Arial', 18)
+    index = len(replay_undos)
+    line = f"Game {replay_number}  Move {index}/{len(replay_game['moves'])}"
+    if index:
+        line += f"  {replay_game['moves'][index - 1]}"
+    if replay_error:
+        line += f"  ({replay_error})"
+    SCREEN.blit(small_font.render(line, True, (200, 200, 200)), (10, 30))
+
+    if analysis_enabled:
+        if analysis:
+            depth, score, best_move, nodes, qnodes, pruned = analysis
+            white_score = score if turn == 'w' else -score
+            if abs(score) > MATE_SCORE - MAX_PLY:
+                plies = MATE_SCORE - abs(score)
+                text = f"Mate in {(plies + 1) // 2}" + (" for White" if white_score > 0 else " for Black")
+            else:
+                text = f"Eval {white_score / 100:+.2f}"
+            text += f"  depth {depth}"
+            if best_move:
+                text += f"  best {move_to_uci(best_move)}"
+            stats = f"nodes {nodes}  quiescence {qnodes}  SEE pruned {pruned}"
+            SCREEN.blit(small_font.render(stats, True, (200, 200, 200)), (10, HEIGHT - 48))
+        else:
+            text = "Engine thinking..."
+        SCREEN.blit(font.render(text, True, (255, 215, 0)), (10, HEIGHT - 76))
+
+    help_text = "Left/Right step  Home/End  N next game  E engine  Esc menu"
+    SCREEN.blit(small_font.render(help_text, True, GRAY), (10, HEIGHT - 24))
+
+def draw_position_db_panel():
+    """List the moves played from the position on the board, with their results"""
+    global position_db_cache
+    if position_db_cache[0] != board_hash:
+        start = time.perf_counter()
+        moves = position_db.lookup(board_hash)
+        position_db_cache = (board_hash, moves, (time.perf_counter() - start) * 1000)
+    _, moves, lookup_ms = position_db_cache
+
+    panel = pygame.Surface((250, 250), pygame.SRCALPHA)
+    panel.fill((0, 0, 0, 190))
+    SCREEN.blit(panel, (WIDTH - 260, 70))
+    font = pygame.font.SysFont('Arial', 18)
+    x, y = WIDTH - 250, 76
+    SCREEN.blit(font.render(f"Database  ({lookup_ms:.3f} ms)", True, WHITE), (x, y))
+    y += 26
+    if not moves:
+        SCREEN.blit(font.render("Position not in database", True, GRAY), (x, y))
+    for move, white, draws, black in moves[:8]:
+        (row, col), (t_row, t_col) = move
+        piece = board[row][col]
+        if isinstance(piece, Piece) and piece.type == 'k' and abs(t_col - col) == 2:
+            name = 'O-O' if t_col > col else 'O-O-O'
+            color = (255, 215, 0)
+        else:
+            name = move_to_uci(move)
+            color = WHITE
+        games = white + draws + black
+        wins = white if turn == 'w' else black
+        score = (wins + draws / 2) / games * 100
+        SCREEN.blit(font.render(f"{name:<7}{games:>8}  {score:5.1f}%", True, color), (x, y))
+        y += 22
+
 def reset_game():
     """Reset game to initial state"""
     global board, selected_piece, selected_pos, turn, moves_made, winner, cpu_thinking
+    global move_history, game_start
+    cancel_engine_search()
     board = init_board()
     selected_piece = None
     selected_pos = None
@@ -460,30 +2159,77 @@ def reset_game():
     moves_made = 0
     winner = None
     cpu_thinking = False
+    move_history = []
+    refresh_position_state()
+    game_start = pack_position()
 
 def main():
-    global selected_piece, selected_pos, turn, moves_made, game_state, player_mode, cpu_thinking
+    global selected_piece, selected_pos, game_state, player_mode, cpu_thinking
+    global position_db, position_db_panel, resumable_game, status_message, SEARCH_PROCESSES
     
     running = True
     legal_moves = []
     legal_captures = []
-    cpu_move_timer = 0
+
+    parser = argparse.ArgumentParser(description="Castling the King - CRSS")
+    parser.add_argument('--replay', metavar='PGN', help="step through the games of a PGN file")
+    parser.add_argument('--db', metavar='FILE', help="position database built by castling_position_db.py")
+    parser.add_argument('--load', metavar='FILE', help="continue a game saved with S")
+    parser.add_argument('--weights', metavar='FILE',
+                        help="evaluation weights from castling_tune.py (default: castling_eval_weights.json if present)")
+    parser.add_argument('--processes', type=int, default=SEARCH_PROCESSES,
+                        help=f"Lazy SMP search processes for the CPU player (default {SEARCH_PROCESSES})")
+    args = parser.parse_args()
+    if args.processes < 1:
+        parser.error("--processes must be at least 1")
+    SEARCH_PROCESSES = args.processes
+    if args.weights:
+        load_eval_weights(args.weights)
+        refresh_position_state()
+    if args.db:
+        position_db = PositionDatabase(args.db)
+    if args.replay:
+        start_replay(args.replay)
+    elif args.load:
+        try:
+            record = read_game_record(args.load)
+        except BAD_RECORD_ERRORS:
+            record = None
+        if record is None:
+            parser.error(f"{args.load} is not a readable saved game")
+        resume_game(record)
+    else:
+        resumable_game = find_resumable_game()
 
     while running:
         CLOCK.tick(FPS)
 
-        # CPU move with delay
-        if (game_state == "playing" and player_mode == "1player" and 
-            turn == 'b' and not cpu_thinking):
-            cpu_move_timer += 1
-            if cpu_move_timer > 30:  # ~0.5 second delay at 60 FPS
-                make_cpu_move()
-                cpu_move_timer = 0
+        # CPU move: the engine process searches while the board keeps drawing
+        if game_state == "playing" and player_mode == "1player" and turn == 'b':
+            if not cpu_thinking:
+                request_cpu_move(move_history[-1] if move_history else None)
+            else:
+                answer = poll_engine()
+                if answer:
+                    cpu_thinking = False
+                    make_cpu_move(answer[0])
+                    if game_state == "playing":
+                        start_pondering(answer[1])
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
 
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_s and game_state == "playing":
+                save_game()
+                status_message = (f"Saved to {os.path.basename(SAVE_FILE)}", time.time() + 2)
+
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_b and position_db:
+                position_db_panel = not position_db_panel
+
+            elif event.type == pygame.KEYDOWN and game_state == "replay":
+                handle_replay_key(event.key)
+
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 pos = pygame.mouse.get_pos()
                 
@@ -492,10 +2238,16 @@ def main():
                         player_mode = "1player"
                         game_state = "playing"
                         reset_game()
+                        start_journal()
+                        resumable_game = None
                     elif button_2p and button_2p.collidepoint(pos):
                         player_mode = "2player"
                         game_state = "playing"
                         reset_game()
+                        start_journal()
+                        resumable_game = None
+                    elif button_resume and button_resume.collidepoint(pos):
+                        resume_game(resumable_game)
                 
                 elif game_state == "game_over":
                     if back_button and back_button.collidepoint(pos):
@@ -515,27 +2267,17 @@ def main():
                     if selected_piece:
                         target = (row, col)
                         if target in legal_moves or target in legal_captures:
-                            if selected_piece.type == 'k' and abs(col - selected_pos[1]) == 2:
-                                perform_castling(selected_pos, target)
-                            else:
-                                board[selected_pos[0]][selected_pos[1]] = ' '
-                                # Handle pawn promotion
-                                if selected_piece.type == 'p' and (row == 0 or row == 7):
-                                    new_queen = Piece(selected_piece.team, 'q')
-                                    new_queen.has_moved = True
-                                    board[row][col] = new_queen
-                                else:
-                                    selected_piece.has_moved = True
-                                    board[row][col] = selected_piece
-                            
+                            # Castling and pawn promotion are handled by make_move
+                            make_move((selected_pos, target))
+
                             selected_piece = None
                             selected_pos = None
                             legal_moves = []
                             legal_captures = []
-                            turn = 'b' if turn == 'w' else 'w'
-                            moves_made += 1
-                            
-                            check_game_over()
+
+                            if check_game_over():
+                                # Nothing left to ponder on; free the engine and its workers
+                                cancel_engine_search()
                         else:
                             if isinstance(piece, Piece) and piece.team == turn:
                                 selected_piece = piece
@@ -552,6 +2294,11 @@ def main():
                             selected_pos = (row, col)
                             legal_moves, legal_captures = get_legal_moves(selected_pos)
 
+        # Autosave: journal the new moves; a finished game has nothing to resume
+        update_journal()
+        if game_state == "game_over" and journal_file is not None:
+            close_journal(remove=True)
+
         # Draw
         if game_state == "menu":
             draw_startup_screen()
@@ -592,7 +2339,29 @@ def main():
             watermark = watermark_font.render("LEGAL NAME FRAUD TRUTH CHANNEL", True, GRAY)
             watermark_rect = watermark.get_rect(center=(WIDTH//2, HEIGHT - 15))
             SCREEN.blit(watermark, watermark_rect)
+
+            if status_message[0] and time.time() < status_message[1]:
+                status = watermark_font.render(status_message[0], True, WHITE)
+                SCREEN.blit(status, (10, HEIGHT - 24))
+
+            if position_db_panel:
+                draw_position_db_panel()
         
+        elif game_state == "replay":
+            poll_engine()
+            SCREEN.fill((50, 50, 50))
+            draw_board()
+            if replay_undos:
+                # Mark the last move
+                overlay = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+                overlay.fill(SELECT)
+                for r, c in replay_moves[len(replay_undos) - 1]:
+                    SCREEN.blit(overlay, board_to_screen(r, c))
+            draw_pieces()
+            draw_replay_info()
+            if position_db_panel:
+                draw_position_db_panel()
+
         elif game_state == "game_over":
             # Keep showing the board
             SCREEN.fill((50, 50, 50))
@@ -604,6 +2373,8 @@ def main():
 
         pygame.display.flip()
 
+    close_journal()
+    stop_engine()
     pygame.quit()
     sys.exit()
 
@@ -0,0 +1,176 @@
+"""Analyse a file of FENs with the CPU search across a process pool.
+
+Positions are streamed from a file or stdin and searched with a node or time
+limit each. Results are written as JSON lines in input order; only a few
+positions per worker are in flight at any time, so memory stays flat however
+long the input is. Progress is checkpointed next to the output, and running
+the same command again after an interruption carries on where it stopped.
+
+    python castling_analyse.py puzzles.txt -o results.jsonl [--nodes 20000 | --movetime 500] [--processes 8]
+    cat puzzles.txt | python castling_analyse.py - -o results.jsonl
+
+Each line holds {"line", "fen", "bestmove", "score", "depth", "nodes", "pv"}
+with the move in coordinate notation and the score as {"cp": n} or
+{"mate": n} from the side to move. Positions without a move get "result"
+instead, unreadable ones "error".
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import collections
+import multiprocessing
+
+# Headless: no window, no pygame banner
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import Castling_of_the_King_OMEGA7755 as game
+
+IN_FLIGHT_PER_WORKER = 4
+CHECKPOINT_SECONDS = 5.0
+REPORT_SECONDS = 10.0
+
+stop_requested = False  # set by Ctrl+C, acted on between positions
+
+def request_stop(signum, frame):
+    # A KeyboardInterrupt could land between writing a line and counting it;
+    # stopping between positions keeps the checkpoint in step with the output
+    global stop_requested
+    stop_requested = True
+
+def score_value(score):
+    if abs(score) > game.MATE_SCORE - game.MAX_PLY:
+        moves = (game.MATE_SCORE - abs(score) + 1) // 2
+        return {'mate': moves if score > 0 else -moves}
+    return {'cp': score}
+
+def analyse(job):
+    """Search one position and return its result as a dict"""
+    number, fen, nodes, movetime, depth = job
+    result = {'line': number, 'fen': fen}
+    try:
+        game.load_fen(fen)
+    except (ValueError, IndexError, KeyError):
+        result['error'] = "unreadable FEN"
+        return result
+    if not game.get_all_legal_moves(game.turn):
+        result['result'] = 'checkmate' if game.is_in_check(game.turn) else 'stalemate'
+        return result
+
+    game.clear_search_state()
+    completed = []
+    start = time.perf_counter()
+    move, _ = game.search_best_move(movetime, depth, processes=1, node_limit=nodes,
+                                    report=lambda d, score, best: completed.append((d, score)))
+    result['bestmove'] = game.move_to_uci(move)
+    if completed:
+        result['depth'], score = completed[-1]
+        result['score'] = score_value(score)
+    result['nodes'] = game.search_nodes
+    result['time_ms'] = int((time.perf_counter() - start) * 1000)
+    result['pv'] = [game.move_to_uci(m) for m in game.principal_variation(move)]
+    return result
+
+def read_jobs(path, skip, nodes, movetime, depth):
+    """Yield a job per FEN line after the first `skip` positions; blank lines and a trailing [label] are ignored"""
+    f = sys.stdin if path == '-' else open(path)
+    with f:
+        seen = 0
+        for number, line in enumerate(f, 1):
+            fen = line.split('[')[0].strip()
+            if not fen:
+                continue
+            seen += 1
+            if seen > skip:
+                yield number, fen, nodes, movetime, depth
+
+def load_checkpoint(path, settings):
+    """Return (positions done, output bytes) from a checkpoint of the same run, or (0, 0)"""
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['settings'] != settings:
+        sys.exit(f"{path} belongs to a run with different settings {checkpoint['settings']}; "
+                 f"delete it to start over")
+    return checkpoint['positions'], checkpoint['bytes']
+
+def save_checkpoint(path, settings, positions, out):
+    """Record progress once everything it covers is on disk"""
+    out.flush()
+    os.fsync(out.fileno())
+    temp = path + '.tmp'
+    with open(temp, 'w') as f:
+        json.dump({'settings': settings, 'positions': positions, 'bytes': out.tell()}, f)
+    os.replace(temp, path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help="file of FENs, or - for stdin")
+    parser.add_argument('-o', '--output', required=True)
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument('--nodes', type=int, help="search nodes per position (default 20000)")
+    limit.add_argument('--movetime', type=int, help="milliseconds per position")
+    parser.add_argument('--depth', type=int, default=game.MAX_SEARCH_DEPTH, help="maximum depth per position")
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    nodes = args.nodes if args.nodes or args.movetime else 20000
+    movetime = args.movetime / 1000 if args.movetime else None
+
+    checkpoint_path = args.output + '.checkpoint'
+    settings = {'input': os.path.abspath(args.input) if args.input != '-' else '-',
+                'nodes': nodes, 'movetime': args.movetime, 'depth': args.depth}
+    done, size = load_checkpoint(checkpoint_path, settings)
+    if done:
+        print(f"resuming after {done} positions", file=sys.stderr)
+    out = open(args.output, 'r+b' if done else 'wb')
+    # Drop anything written after the last checkpoint; those positions are searched again
+    out.truncate(size)
+    out.seek(size)
+
+    start = last_report = last_checkpoint = time.perf_counter()
+    written = 0
+    pending = collections.deque()
+    pool = multiprocessing.Pool(args.processes, game.reset_child_signals)
+    signal.signal(signal.SIGINT, request_stop)
+
+    def write(result):
+        nonlocal written, last_report, last_checkpoint
+        out.write(json.dumps(result).encode() + b'\n')
+        written += 1
+        now = time.perf_counter()
+        if now - last_checkpoint >= CHECKPOINT_SECONDS:
+            save_checkpoint(checkpoint_path, settings, done + written, out)
+            last_checkpoint = now
+        if now - last_report >= REPORT_SECONDS:
+            print(f"{done + written} positions, {written / (now - start):.1f} positions/s", file=sys.stderr)
+            last_report = now
+
+    # At most IN_FLIGHT_PER_WORKER jobs per worker are queued; results leave in input order
+    for job in read_jobs(args.input, done, nodes, movetime, args.depth):
+        if stop_requested:
+            break
+        pending.append(pool.apply_async(analyse, (job,)))
+        if len(pending) >= args.processes * IN_FLIGHT_PER_WORKER:
+            write(pending.popleft().get())
+    while pending and not stop_requested:
+        write(pending.popleft().get())
+    if stop_requested:
+        pool.terminate()
+        save_checkpoint(checkpoint_path, settings, done + written, out)
+        sys.exit(f"interrupted after {done + written} positions; run again to resume")
+    pool.close()
+    pool.join()
+    out.close()
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    elapsed = time.perf_counter() - start
+    print(f"{done + written} positions ({written} this run) in {elapsed:.1f}s, "
+          f"{written / max(elapsed, 1e-9):.1f} positions/s -> {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""Regression benchmarks for both copies of the rules.
+
+Times fixed workloads on Castling_of_the_King_OMEGA7755.py and the older
+FINALCastlingCRSS.py: perft from set positions, is_square_attacked over every
+square, a fixed-depth search (OMEGA only, FINAL has no CPU player) and drawing
+frames offscreen under the dummy SDL video driver. Each run is appended to a
+JSON history file; compare reports the change between two runs and exits
+non-zero when a workload got slower than the threshold or its node count moved.
+
+    python castling_bench.py run [--repeat 3] [--only omega/perft] [--label "after ray scan"]
+    python castling_bench.py compare [--base -2] [--new -1] [--threshold 10]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+# Headless: no window, no pygame banner
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame
+import Castling_of_the_King_OMEGA7755 as game
+import FINALCastlingCRSS as final
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'castling_bench_history.json')
+
+# (name, FEN, perft depth). Both copies must agree on the node counts.
+PERFT_POSITIONS = [
+    ('start', game.START_FEN, 3),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', 2),
+    ('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', 3),
+]
+# Passes over all 64 squares for both sides. FINAL answers each query by
+# generating the attacker's moves, so it gets fewer.
+ATTACK_ROUNDS = {'omega': 500, 'final': 40}
+SEARCH_DEPTH = 4
+RENDER_FRAMES = 300
+
+def load_final(fen):
+    """Set up the FINAL copy's board from a FEN, via the OMEGA parser"""
+    game.load_fen(fen)
+    for row in range(8):
+        for col in range(8):
+            piece = game.board[row][col]
+            if isinstance(piece, game.Piece):
+                copy = final.Piece(piece.type, piece.team)
+                copy.has_moved = piece.has_moved
+                final.board[row][col] = copy
+            else:
+                final.board[row][col] = ' '
+    final.turn = game.turn
+
+def omega_perft(depth):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in game.get_all_legal_moves(game.turn):
+        undo = game.make_move(move)
+        nodes += omega_perft(depth - 1)
+        game.unmake_move(undo)
+    return nodes
+
+def final_perft(depth):
+    """Perft with FINAL's rules, which move pieces by hand and have no undo"""
+    if depth == 0:
+        return 1
+    board = final.board
+    team = final.turn
+    nodes = 0
+    for row in range(8):
+        for col in range(8):
+            piece = board[row][col]
+            if not isinstance(piece, final.Piece) or piece.team != team:
+                continue
+            moves, captures = final.get_legal_moves((row, col))
+            for t_row, t_col in moves + captures:
+                squares = [line[:] for line in board]
+                flags = [(p, p.has_moved) for line in board for p in line if isinstance(p, final.Piece)]
+                if piece.type == 'k' and abs(t_col - col) == 2:
+                    final.perform_castling((row, col), (t_row, t_col))
+                else:
+                    board[t_row][t_col] = piece
+                    board[row][col] = ' '
+                    piece.has_moved = True
+                final.turn = 'b' if team == 'w' else 'w'
+                nodes += final_perft(depth - 1)
+                board[:] = squares
+                for p, moved in flags:
+                    p.has_moved = moved
+                final.turn = team
+    return nodes
+
+def perft_workload(module, fen, depth):
+    if module is game:
+        game.load_fen(fen)
+        return lambda: omega_perft(depth)
+    load_final(fen)
+    return lambda: final_perft(depth)
+
+def attack_workload(module, fen, rounds):
+    if module is game:
+        game.load_fen(fen)
+    else:
+        load_final(fen)
+
+    def run():
+        attacked = 0
+        for _ in range(rounds):
+            for row in range(8):
+                for col in range(8):
+                    attacked += module.is_square_attacked(row, col, 'w')
+                    attacked += module.is_square_attacked(row, col, 'b')
+        return attacked
+    return run
+
+def search_workload(fen, depth):
+    game.load_fen(fen)
+    game.clear_search_state()
+    game.SEARCH_PROCESSES = 1
+
+    def run():
+        game.search_best_move(max_depth=depth)
+        return game.search_nodes
+    return run
+
+def render_workload(module, fen, frames):
+    if module is game:
+        game.load_fen(fen)
+    else:
+        load_final(fen)
+
+    def run():
+        for _ in range(frames):
+            module.SCREEN.fill((50, 50, 50))
+            module.draw_board()
+            module.draw_pieces()
+            pygame.display.flip()
+        return frames
+    return run
+
+def benchmarks():
+    """Yield (name, setup) pairs; setup prepares the position and returns the timed workload.
+
+    The workload returns a count (nodes, attacked squares, frames) that only
+    changes when behaviour does, so compare can tell a speedup from a bug.
+    """
+    for name, fen, depth in PERFT_POSITIONS:
+        for label, module in (('omega', game), ('final', final)):
+            yield (f"{label}/perft/{name}-d{depth}",
+                   lambda fen=fen, module=module, depth=depth: perft_workload(module, fen, depth))
+    for name, fen, _ in PERFT_POSITIONS:
+        for label, module in (('omega', game), ('final', final)):
+            rounds = ATTACK_ROUNDS[label]
+            yield (f"{label}/attacked/{name}-x{rounds}",
+                   lambda fen=fen, module=module, rounds=rounds: attack_workload(module, fen, rounds))
+    for name, fen, _ in PERFT_POSITIONS:
+        yield f"omega/search/{name}-d{SEARCH_DEPTH}", lambda fen=fen: search_workload(fen, SEARCH_DEPTH)
+    for label, module in (('omega', game), ('final', final)):
+        yield (f"{label}/render/start-f{RENDER_FRAMES}",
+               lambda module=module: render_workload(module, game.START_FEN, RENDER_FRAMES))
+
+def git_commit():
+    try:
+        output = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+def load_history(path):
+    if not os.path.exists(path):
+        return {'runs': []}
+    with open(path) as f:
+        return json.load(f)
+
+def save_history(history, path):
+    """Write the history through a temporary file so an interrupted run cannot truncate it"""
+    temp = path + '.tmp'
+    with open(temp, 'w') as f:
+        json.dump(history, f, indent=1)
+    os.replace(temp, path)
+
+def run(args):
+    results = {}
+    for name, setup in benchmarks():
+        if args.only and not any(pattern in name for pattern in args.only):
+            continue
+        best, count = None, None
+        for _ in range(args.repeat):
+            workload = setup()
+            start = time.perf_counter()
+            count = workload()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {'seconds': round(best, 6), 'count': count}
+        print(f"{name:<36}{best:10.4f}s  {count:>10}")
+
+    history = load_history(args.history)
+    history['runs'].append({
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'label': args.label,
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'repeat': args.repeat,
+        'results': results,
+    })
+    save_history(history, args.history)
+    print(f"run {len(history['runs']) - 1} saved to {args.history}")
+
+def describe(run_record, index):
+    label = f" '{run_record['label']}'" if run_record.get('label') else ''
+    return f"run {index} ({run_record['time']}, {run_record.get('commit') or 'no commit'}{label})"
+
+def compare(args):
+    runs = load_history(args.history)['runs']
+    try:
+        base, new = runs[args.base], runs[args.new]
+    except IndexError:
+        sys.exit(f"{args.history} has {len(runs)} runs; need runs {args.base} and {args.new}")
+    base_index = args.base % len(runs)
+    new_index = args.new % len(runs)
+    print(f"{describe(base, base_index)} -> {describe(new, new_index)}")
+
+    regressions = 0
+    for name, result in new['results'].items():
+        before = base['results'].get(name)
+        if before is None:
+            print(f"{name:<36}{'':>10}  {result['seconds']:9.4f}s  new")
+            continue
+        change = (result['seconds'] - before['seconds']) / before['seconds'] * 100
+        flag = ''
+        if result['count'] != before['count']:
+            flag = f"  COUNT CHANGED {before['count']} -> {result['count']}"
+            regressions += 1
+        elif change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{name:<36}{before['seconds']:9.4f}s {result['seconds']:9.4f}s {change:+7.1f}%{flag}")
+
+    if regressions:
+        print(f"{regressions} regressions beyond {args.threshold:g}%")
+        sys.exit(1)
+    print(f"no regressions beyond {args.threshold:g}%")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history', default=HISTORY_FILE)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="time every workload and append the results")
+    run_parser.add_argument('--repeat', type=int, default=3, help="keep the best of this many timings")
+    run_parser.add_argument('--only', nargs='*', help="run only workloads whose name contains one of these")
+    run_parser.add_argument('--label', help="note stored with the run")
+    compare_parser = commands.add_parser('compare', help="compare two stored runs")
+    compare_parser.add_argument('--base', type=int, default=-2, help="index of the earlier run")
+    compare_parser.add_argument('--new', type=int, default=-1, help="index of the later run")
+    compare_parser.add_argument('--threshold', type=float, default=10.0,
+                                help="percent slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args)
+    else:
+        compare(args)
+
+if __name__ == "__main__":
+    main()
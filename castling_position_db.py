@@ -0,0 +1,140 @@
+"""Build and query the position database used by the board view's database panel.
+
+Games are streamed from PGN through the game's own move logic (make_move and
+perform_castling), so positions are keyed by the same Zobrist hash the game
+uses. The index is a sorted file of fixed-size records that the game searches
+in place through mmap.
+
+    python castling_position_db.py ingest games.pgn [more.pgn ...] -o positions.idx
+    python castling_position_db.py query positions.idx [--fen FEN] [--moves e4 e5 Nf3]
+"""
+import os
+import sys
+import time
+import heapq
+import argparse
+import tempfile
+
+# Headless: no window, no pygame banner
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import Castling_of_the_King_OMEGA7755 as game
+
+RUN_ENTRIES = 2000000  # (position, move) pairs held in memory before spilling a sorted run
+RESULT_SLOTS = {'1-0': 0, '1/2-1/2': 1, '0-1': 2}
+
+def write_run(counts, directory):
+    """Write the counts to a temporary file as sorted records and return its path"""
+    fd, path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        for (key, code), (white, draws, black) in sorted(counts.items()):
+            f.write(game.POSITION_DB_RECORD.pack(key, code, white, draws, black))
+    return path
+
+def read_run(path):
+    """Yield ((key, code), counts) records from a run file"""
+    size = game.POSITION_DB_RECORD.size
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(size * 65536)
+            if not chunk:
+                break
+            for key, code, white, draws, black in game.POSITION_DB_RECORD.iter_unpack(chunk):
+                yield (key, code), (white, draws, black)
+
+def ingest(pgn_paths, output, max_plies):
+    """Stream the games into an index file; memory is bounded by RUN_ENTRIES"""
+    directory = os.path.dirname(os.path.abspath(output))
+    counts = {}
+    runs = []
+    games = skipped = 0
+    start = time.perf_counter()
+
+    for path in pgn_paths:
+        for pgn in game.read_pgn_file(path):
+            slot = RESULT_SLOTS.get(pgn['result'])
+            if slot is None:
+                skipped += 1
+                continue
+            game.reset_game()
+            if 'FEN' in pgn['headers']:
+                game.load_fen(pgn['headers']['FEN'])
+            for san in pgn['moves'][:max_plies]:
+                move = game.move_from_san(san)
+                if move is None:
+                    break  # en passant or underpromotion: the rest of the game is unreachable
+                entry = counts.setdefault((game.board_hash, game.encode_move(move)), [0, 0, 0])
+                entry[slot] += 1
+                game.make_move(move)
+            games += 1
+            if len(counts) >= RUN_ENTRIES:
+                runs.append(write_run(counts, directory))
+                counts = {}
+            if games % 1000 == 0:
+                print(f"{games} games, {games / (time.perf_counter() - start):.0f} games/s", file=sys.stderr)
+    runs.append(write_run(counts, directory))
+
+    # Merge the sorted runs, adding up records for the same position and move
+    records = 0
+    with open(output, 'wb') as f:
+        f.write(game.POSITION_DB_HEADER.pack(game.POSITION_DB_MAGIC, 0))
+        current, total = None, None
+        for key, entry in heapq.merge(*[read_run(run) for run in runs]):
+            if key == current:
+                total = [a + b for a, b in zip(total, entry)]
+                continue
+            if current is not None:
+                f.write(game.POSITION_DB_RECORD.pack(*current, *total))
+                records += 1
+            current, total = key, list(entry)
+        if current is not None:
+            f.write(game.POSITION_DB_RECORD.pack(*current, *total))
+            records += 1
+        f.seek(0)
+        f.write(game.POSITION_DB_HEADER.pack(game.POSITION_DB_MAGIC, records))
+    for run in runs:
+        os.remove(run)
+
+    print(f"{games} games ({skipped} without a result skipped), {records} records "
+          f"in {time.perf_counter() - start:.1f}s -> {output}")
+
+def query(path, fen, sans):
+    db = game.PositionDatabase(path)
+    game.load_fen(fen)
+    for san in sans:
+        move = game.move_from_san(san)
+        if move is None:
+            sys.exit(f"{san} is not playable in {game.board_to_fen()}")
+        game.make_move(move)
+
+    start = time.perf_counter()
+    moves = db.lookup(game.board_hash)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{game.board_to_fen()}: {len(moves)} moves ({elapsed:.3f} ms)")
+    for move, white, draws, black in moves:
+        games = white + draws + black
+        print(f"  {game.move_to_uci(move):<6}{games:>9}  +{white} ={draws} -{black}")
+    db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = commands.add_parser('ingest', help="build an index from PGN files")
+    ingest_parser.add_argument('pgn', nargs='+')
+    ingest_parser.add_argument('-o', '--output', required=True)
+    ingest_parser.add_argument('--max-plies', type=int, default=60,
+                               help="index only this many plies of each game")
+    query_parser = commands.add_parser('query', help="list the moves played from a position")
+    query_parser.add_argument('index')
+    query_parser.add_argument('--fen', default=game.START_FEN)
+    query_parser.add_argument('--moves', nargs='*', default=[], help="SAN moves played from the FEN")
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        ingest(args.pgn, args.output, args.max_plies)
+    else:
+        query(args.index, args.fen, args.moves)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Render games or FEN lists to PNG sequences without a window.
+
+Frames have the game's look (draw_board squares and Piece.draw pieces) but are
+drawn on offscreen Surfaces under the dummy SDL driver. Each worker process
+draws the board and every piece sprite once, so a frame is a background blit
+plus one blit per piece.
+
+    python castling_render.py games games.pgn [more.pgn ...] -o frames/ [--processes 8] [--size 480]
+    python castling_render.py fens positions.txt -o frames/      (use - to read FENs from stdin)
+
+Games go to frames/game0001/000.png, 001.png, ... (one frame per ply, the last
+move marked); FENs go to frames/000001.png, ... numbered by input line.
+"""
+import os
+import sys
+import time
+import argparse
+import itertools
+import multiprocessing
+
+# Headless: no window, no pygame banner
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame
+import Castling_of_the_King_OMEGA7755 as game
+
+FEN_BATCH = 64  # FENs handed to a worker at a time
+
+# Per-process caches, filled on first use in each worker
+sprites = {}  # (type, team) -> piece drawn on a transparent square
+background = None
+last_move_overlay = None
+frame = None
+
+def piece_sprite(piece_type, team):
+    sprite = sprites.get((piece_type, team))
+    if sprite is None:
+        sprite = pygame.Surface((game.SQUARE_SIZE, game.SQUARE_SIZE), pygame.SRCALPHA)
+        game.Piece(piece_type, team).draw(sprite, 0, 0)
+        sprites[(piece_type, team)] = sprite
+    return sprite
+
+def render_frame(last_move=None, size=None):
+    """Draw the board of the game module into the worker's frame and return it"""
+    global background, last_move_overlay, frame
+    if background is None:
+        background = pygame.Surface((game.WIDTH, game.HEIGHT))
+        game.draw_board(background)
+        last_move_overlay = pygame.Surface((game.SQUARE_SIZE, game.SQUARE_SIZE), pygame.SRCALPHA)
+        last_move_overlay.fill(game.SELECT)
+        frame = pygame.Surface((game.WIDTH, game.HEIGHT))
+
+    frame.blit(background, (0, 0))
+    if last_move:
+        for row, col in last_move:
+            frame.blit(last_move_overlay, game.board_to_screen(row, col))
+    for row in range(8):
+        for col in range(8):
+            piece = game.board[row][col]
+            if isinstance(piece, game.Piece):
+                frame.blit(piece_sprite(piece.type, piece.team), game.board_to_screen(row, col))
+    if size and size != game.WIDTH:
+        return pygame.transform.smoothscale(frame, (size, size))
+    return frame
+
+def render_game(job):
+    """Replay one PGN game and save a frame per ply; returns (frames, note)"""
+    number, pgn, output, size = job
+    directory = os.path.join(output, f"game{number:04d}")
+    os.makedirs(directory, exist_ok=True)
+    game.reset_game()
+    if 'FEN' in pgn['headers']:
+        game.load_fen(pgn['headers']['FEN'])
+    pygame.image.save(render_frame(size=size), os.path.join(directory, '000.png'))
+    for ply, san in enumerate(pgn['moves'], 1):
+        move = game.move_from_san(san)
+        if move is None:
+            return ply, f"game {number}: stopped at {san}, not playable under these rules"
+        game.make_move(move)
+        pygame.image.save(render_frame(move, size), os.path.join(directory, f"{ply:03d}.png"))
+    return len(pgn['moves']) + 1, None
+
+def render_fens(job):
+    """Save a frame for each (line number, FEN) of a batch; returns (frames, note)"""
+    batch, output, size = job
+    frames = 0
+    bad = []
+    for number, fen in batch:
+        try:
+            game.load_fen(fen)
+        except (ValueError, IndexError, KeyError):
+            bad.append(str(number))
+            continue
+        pygame.image.save(render_frame(size=size), os.path.join(output, f"{number:06d}.png"))
+        frames += 1
+    return frames, f"unreadable FEN on line {', '.join(bad)}" if bad else None
+
+def game_jobs(paths, output, size):
+    number = 0
+    for path in paths:
+        for pgn in game.read_pgn_file(path):
+            number += 1
+            yield number, pgn, output, size
+
+def fen_jobs(path, output, size):
+    """Batch the FENs of a file (or stdin) with their line numbers; a trailing [result] is ignored"""
+    f = sys.stdin if path == '-' else open(path)
+    with f:
+        lines = ((number, line.split('[')[0].strip()) for number, line in enumerate(f, 1))
+        lines = (entry for entry in lines if entry[1])
+        while True:
+            batch = list(itertools.islice(lines, FEN_BATCH))
+            if not batch:
+                break
+            yield batch, output, size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    games_parser = commands.add_parser('games', help="one PNG per ply of every game in PGN files")
+    games_parser.add_argument('pgn', nargs='+')
+    fens_parser = commands.add_parser('fens', help="one PNG per FEN line")
+    fens_parser.add_argument('fens', help="file of FENs, or - for stdin")
+    for command in (games_parser, fens_parser):
+        command.add_argument('-o', '--output', required=True)
+        command.add_argument('--processes', type=int, default=os.cpu_count())
+        command.add_argument('--size', type=int, help=f"image width and height (default {game.WIDTH})")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    if args.command == 'games':
+        worker, jobs = render_game, game_jobs(args.pgn, args.output, args.size)
+    else:
+        worker, jobs = render_fens, fen_jobs(args.fens, args.output, args.size)
+
+    start = time.perf_counter()
+    frames = 0
+    with multiprocessing.Pool(args.processes, game.reset_child_signals) as pool:
+        for count, note in pool.imap_unordered(worker, jobs):
+            frames += count
+            if note:
+                print(note, file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(f"{frames} frames in {elapsed:.1f}s ({frames / max(elapsed, 1e-9):.0f} frames/s) -> {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Time-to-depth benchmark for the Lazy SMP search.
+
+Searches a few fixed positions to a fixed depth with 1, 2, 4 and 8 worker
+processes and reports the speedup over a single worker.
+
+    python castling_smp_bench.py [--depth 4] [--processes 1 2 4 8]
+"""
+import os
+import time
+import argparse
+
+# Headless: no window, no pygame banner
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import Castling_of_the_King_OMEGA7755 as game
+
+# Positions reached from the start by these moves ((row, col), (t_row, t_col))
+BENCH_LINES = [
+    [],
+    [((6, 4), (4, 4)), ((1, 4), (3, 4)), ((7, 6), (5, 5)), ((0, 1), (2, 2)), ((7, 5), (4, 2))],
+    [((6, 3), (4, 3)), ((1, 3), (3, 3)), ((6, 2), (4, 2)), ((1, 4), (2, 4)), ((7, 1), (5, 2)), ((0, 6), (2, 5))],
+]
+
+def time_to_depth(depth, processes):
+    """Return the total seconds needed to finish `depth` on every bench position"""
+    total = 0.0
+    for line in BENCH_LINES:
+        game.reset_game()
+        for move in line:
+            game.make_move(move)
+        game.start_search_workers(processes)
+        game.transposition_table.clear()
+        start = time.perf_counter()
+        game.parallel_search(max_depth=depth, processes=processes)
+        total += time.perf_counter() - start
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"Lazy SMP time to depth {args.depth} over {len(BENCH_LINES)} positions "
+          f"({os.cpu_count()} CPUs available)")
+    baseline = None
+    for processes in args.processes:
+        seconds = time_to_depth(args.depth, processes)
+        if baseline is None:
+            baseline = seconds
+        print(f"{processes:2d} processes: {seconds:8.2f}s  speedup {baseline / seconds:5.2f}x")
+    game.stop_search_workers()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""Texel tuning of the evaluation's piece values and piece-square tables.
+
+Quiet positions (not in check, no capture that changes the quiescence score)
+are labelled with the result of the game they came from, either from PGN
+files or from self-play. The fit encodes them as NumPy arrays and adjusts the
+midgame and endgame weights by Adam gradient steps so that
+1 / (1 + 10^(-K * eval / 400)) predicts the result. The weight file it writes
+is loaded by the game, the engine process and castling_uci.py at startup.
+
+    python castling_tune.py extract games.pgn [more.pgn ...] -o positions.txt
+    python castling_tune.py selfplay --games 200 --nodes 3000 -o positions.txt
+    python castling_tune.py fit positions.txt [more.txt ...] [-o castling_eval_weights.json]
+
+Position files hold one `<FEN> [<result>]` line per position, the result
+being 1.0, 0.5 or 0.0 from White's side.
+"""
+import os
+import sys
+import math
+import time
+import json
+import random
+import argparse
+import multiprocessing
+
+# Headless: no window, no pygame banner
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+import Castling_of_the_King_OMEGA7755 as game
+
+RESULT_SCORES = {'1-0': 1.0, '1/2-1/2': 0.5, '0-1': 0.0}
+SKIP_PLIES = 8  # opening positions say little about the result
+MAX_GAME_PLIES = 300  # self-play games this long are scored as draws
+
+# Feature layout, the same for the midgame and endgame weight vectors: one
+# material weight per piece type, then a 64-square table per type written from
+# White's side. Every piece contributes +1 (White) or -1 (Black) to its
+# material feature and its square feature; unused slots point at PAD, whose
+# weight stays zero.
+PIECE_TYPES = 'pnbrqk'
+MATERIAL = {piece_type: i for i, piece_type in enumerate(PIECE_TYPES)}
+TABLE_OFFSET = len(PIECE_TYPES)
+FEATURES = TABLE_OFFSET + 64 * len(PIECE_TYPES)
+PAD = FEATURES
+SLOTS = 64  # two features for each of at most 32 pieces
+FROZEN = [MATERIAL['k'], PAD]  # the king has no material value
+
+def is_quiet():
+    """Check if the position on the board is quiet enough to label with a game result"""
+    if game.is_in_check(game.turn):
+        return False
+    game.start_search_clock()
+    return game.quiescence(-game.MATE_SCORE, game.MATE_SCORE, 0) == game.evaluate()
+
+def extract(pgn_paths, output):
+    """Write the quiet positions of every finished game in the PGN files"""
+    games = positions = 0
+    with open(output, 'w') as out:
+        for path in pgn_paths:
+            for pgn in game.read_pgn_file(path):
+                result = RESULT_SCORES.get(pgn['result'])
+                if result is None:
+                    continue
+                game.reset_game()
+                if 'FEN' in pgn['headers']:
+                    game.load_fen(pgn['headers']['FEN'])
+                for ply, san in enumerate(pgn['moves']):
+                    move = game.move_from_san(san)
+                    if move is None:
+                        break  # en passant or underpromotion: the rest of the game is unreachable
+                    game.make_move(move)
+                    if ply + 1 >= SKIP_PLIES and is_quiet():
+                        out.write(f"{game.board_to_fen()} [{result}]\n")
+                        positions += 1
+                games += 1
+    print(f"{games} games, {positions} quiet positions -> {output}")
+
+def play_game(args):
+    """Play one self-play game and return (quiet FENs, result from White's side)"""
+    seed, nodes, random_plies = args
+    rng = random.Random(seed)
+    game.reset_game()
+    game.clear_search_state()
+    fens = []
+    result = 0.5
+    for ply in range(MAX_GAME_PLIES):
+        moves = game.get_all_legal_moves(game.turn)
+        if not moves:
+            if game.is_in_check(game.turn):
+                result = 0.0 if game.turn == 'w' else 1.0
+            break
+        if game.repetition_count() >= 2 or game.halfmove_clock >= 100:
+            break
+        if ply < random_plies:
+            move = rng.choice(moves)
+        else:
+            if ply >= SKIP_PLIES and is_quiet():
+                fens.append(game.board_to_fen())
+            move, _ = game.search_best_move(node_limit=nodes)
+        game.make_move(move)
+    return fens, result
+
+def selfplay(output, games, nodes, random_plies, processes, seed):
+    """Play games against itself in a process pool and write their quiet positions"""
+    start = time.perf_counter()
+    positions = 0
+    jobs = [(seed + i, nodes, random_plies) for i in range(games)]
+    with multiprocessing.Pool(processes, game.reset_child_signals) as pool, open(output, 'w') as out:
+        for done, (fens, result) in enumerate(pool.imap_unordered(play_game, jobs), 1):
+            for fen in fens:
+                out.write(f"{fen} [{result}]\n")
+            positions += len(fens)
+            if done % 10 == 0 or done == games:
+                print(f"{done}/{games} games, {positions} positions, "
+                      f"{time.perf_counter() - start:.0f}s", file=sys.stderr)
+    print(f"{games} games, {positions} quiet positions -> {output}")
+
+def encode_fen(placement, indices, signs, row):
+    """Fill one row of the feature arrays from a FEN piece placement; return the game phase"""
+    slot = phase = 0
+    for r, rank in enumerate(placement.split('/')):
+        c = 0
+        for ch in rank:
+            if ch.isdigit():
+                c += int(ch)
+                continue
+            piece_type = ch.lower()
+            white = ch.isupper()
+            square = r * 8 + c if white else (7 - r) * 8 + c
+            sign = 1 if white else -1
+            indices[row, slot] = MATERIAL[piece_type]
+            indices[row, slot + 1] = TABLE_OFFSET + MATERIAL[piece_type] * 64 + square
+            signs[row, slot] = signs[row, slot + 1] = sign
+            slot += 2
+            phase += game.PHASE_WEIGHTS[piece_type]
+            c += 1
+    return min(phase, game.MAX_PHASE)
+
+def load_positions(paths):
+    """Read position files into (indices, signs, phase, results) arrays"""
+    lines = []
+    for path in paths:
+        with open(path) as f:
+            lines.extend(line for line in f if line.strip())
+    count = len(lines)
+    indices = np.full((count, SLOTS), PAD, dtype=np.int16)
+    signs = np.zeros((count, SLOTS), dtype=np.int8)
+    phase = np.empty(count, dtype=np.float64)
+    results = np.empty(count, dtype=np.float64)
+    for row, line in enumerate(lines):
+        fen, _, label = line.rpartition(' [')
+        results[row] = float(label.rstrip().rstrip(']'))
+        phase[row] = encode_fen(fen.split()[0], indices, signs, row) / game.MAX_PHASE
+    return indices, signs, phase, results
+
+def current_weights():
+    """Return the game's weights as (midgame, endgame) feature vectors"""
+    midgame = np.zeros(FEATURES + 1)
+    endgame = np.zeros(FEATURES + 1)
+    for piece_type in PIECE_TYPES:
+        i = MATERIAL[piece_type]
+        midgame[i] = game.PIECE_VALUES[piece_type]
+        endgame[i] = game.ENDGAME_PIECE_VALUES[piece_type]
+        table = TABLE_OFFSET + i * 64
+        midgame[table:table + 64] = game.MIDGAME_PIECE_SQUARE_TABLES[piece_type]
+        endgame[table:table + 64] = game.ENDGAME_PIECE_SQUARE_TABLES[piece_type]
+    return midgame, endgame
+
+def evaluate_batch(midgame, endgame, indices, signs, phase):
+    """Tapered evaluation from White's side of every position in the batch, as in game.evaluate"""
+    mg = (midgame[indices] * signs).sum(axis=1)
+    eg = (endgame[indices] * signs).sum(axis=1)
+    return mg * phase + eg * (1 - phase)
+
+def predict(scores, k):
+    return 1 / (1 + np.power(10.0, -k * scores / 400))
+
+def mean_error(midgame, endgame, data, k, chunk=65536):
+    indices, signs, phase, results = data
+    total = 0.0
+    for i in range(0, len(results), chunk):
+        part = slice(i, i + chunk)
+        scores = evaluate_batch(midgame, endgame, indices[part], signs[part], phase[part])
+        total += ((results[part] - predict(scores, k)) ** 2).sum()
+    return total / len(results)
+
+def fit_k(midgame, endgame, data):
+    """Find the scaling constant K that best fits the current weights (golden-section search)"""
+    low, high = 0.1, 3.0
+    ratio = (math.sqrt(5) - 1) / 2
+    for _ in range(30):
+        a = high - ratio * (high - low)
+        b = low + ratio * (high - low)
+        if mean_error(midgame, endgame, data, a) < mean_error(midgame, endgame, data, b):
+            high = b
+        else:
+            low = a
+    return (low + high) / 2
+
+def fit(midgame, endgame, data, k, epochs, batch, rate, seed):
+    """Minimise the mean squared prediction error with mini-batch Adam steps"""
+    indices, signs, phase, results = data
+    weights = np.concatenate([midgame, endgame])
+    moment = np.zeros_like(weights)
+    velocity = np.zeros_like(weights)
+    frozen = FROZEN + [FEATURES + 1 + i for i in FROZEN]
+    rng = np.random.default_rng(seed)
+    step = 0
+    for epoch in range(1, epochs + 1):
+        order = rng.permutation(len(results))
+        for i in range(0, len(order), batch):
+            part = order[i:i + batch]
+            idx, sgn, ph = indices[part], signs[part], phase[part]
+            midgame, endgame = weights[:FEATURES + 1], weights[FEATURES + 1:]
+            p = predict(evaluate_batch(midgame, endgame, idx, sgn, ph), k)
+            # d(error)/d(score) for each position, then spread over its features
+            d_score = -2 * (results[part] - p) * p * (1 - p) * k * math.log(10) / 400 / len(part)
+            flat = idx.ravel().astype(np.intp)
+            gradient = np.concatenate([
+                np.bincount(flat, weights=((d_score * ph)[:, None] * sgn).ravel(), minlength=FEATURES + 1),
+                np.bincount(flat, weights=((d_score * (1 - ph))[:, None] * sgn).ravel(), minlength=FEATURES + 1),
+            ])
+            gradient[frozen] = 0
+            step += 1
+            moment = 0.9 * moment + 0.1 * gradient
+            velocity = 0.999 * velocity + 0.001 * gradient ** 2
+            weights -= rate * (moment / (1 - 0.9 ** step)) / (np.sqrt(velocity / (1 - 0.999 ** step)) + 1e-8)
+        midgame, endgame = weights[:FEATURES + 1], weights[FEATURES + 1:]
+        print(f"epoch {epoch:3d}  error {mean_error(midgame, endgame, data, k):.6f}", file=sys.stderr)
+    return weights[:FEATURES + 1].copy(), weights[FEATURES + 1:].copy()
+
+def weight_tables(vector):
+    """Split a feature vector into integer piece values and piece-square tables.
+
+    Adding a constant to a piece's table and taking it off its value leaves
+    every evaluation unchanged, so each table is centred on zero.
+    """
+    values, tables = {}, {}
+    for piece_type in PIECE_TYPES:
+        i = MATERIAL[piece_type]
+        table = vector[TABLE_OFFSET + i * 64:TABLE_OFFSET + i * 64 + 64].copy()
+        # Pawns never stand on the back ranks
+        squares = slice(8, 56) if piece_type == 'p' else slice(0, 64)
+        shift = table[squares].mean()
+        table[squares] -= shift
+        if piece_type == 'p':
+            table[:8] = table[56:] = 0
+        values[piece_type] = 0 if piece_type == 'k' else int(round(vector[i] + shift))
+        tables[piece_type] = [int(round(x)) for x in table]
+    return values, tables
+
+def run_fit(paths, output, epochs, batch, rate, seed):
+    start = time.perf_counter()
+    data = load_positions(paths)
+    print(f"{len(data[3])} positions encoded in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    midgame, endgame = current_weights()
+    k = fit_k(midgame, endgame, data)
+    before = mean_error(midgame, endgame, data, k)
+    print(f"K = {k:.3f}, error {before:.6f}", file=sys.stderr)
+
+    midgame, endgame = fit(midgame, endgame, data, k, epochs, batch, rate, seed)
+    values, midgame_tables = weight_tables(midgame)
+    endgame_values, endgame_tables = weight_tables(endgame)
+    weights = {
+        'piece_values': values,
+        'endgame_piece_values': endgame_values,
+        'midgame_piece_square_tables': midgame_tables,
+        'endgame_piece_square_tables': endgame_tables,
+        'k': round(k, 4),
+        'positions': len(data[3]),
+        'error': round(mean_error(midgame, endgame, data, k), 6),
+    }
+    with open(output, 'w') as f:
+        json.dump(weights, f, indent=1)
+    print(f"error {before:.6f} -> {weights['error']:.6f} in {time.perf_counter() - start:.1f}s -> {output}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    extract_parser = commands.add_parser('extract', help="collect quiet positions from PGN files")
+    extract_parser.add_argument('pgn', nargs='+')
+    extract_parser.add_argument('-o', '--output', required=True)
+    selfplay_parser = commands.add_parser('selfplay', help="collect quiet positions from self-play games")
+    selfplay_parser.add_argument('-o', '--output', required=True)
+    selfplay_parser.add_argument('--games', type=int, default=100)
+    selfplay_parser.add_argument('--nodes', type=int, default=3000, help="search nodes per move")
+    selfplay_parser.add_argument('--random-plies', type=int, default=6,
+                                 help="random opening moves, so the games differ")
+    selfplay_parser.add_argument('--processes', type=int, default=os.cpu_count())
+    selfplay_parser.add_argument('--seed', type=int, default=1)
+    fit_parser = commands.add_parser('fit', help="tune the weights on position files")
+    fit_parser.add_argument('positions', nargs='+')
+    fit_parser.add_argument('-o', '--output', default=game.EVAL_WEIGHTS_FILE)
+    fit_parser.add_argument('--epochs', type=int, default=30)
+    fit_parser.add_argument('--batch', type=int, default=16384)
+    fit_parser.add_argument('--rate', type=float, default=1.0, help="Adam step size in centipawns")
+    fit_parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'extract':
+        extract(args.pgn, args.output)
+    elif args.command == 'selfplay':
+        selfplay(args.output, args.games, args.nodes, args.random_plies, args.processes, args.seed)
+    else:
+        run_fit(args.positions, args.output, args.epochs, args.batch, args.rate, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""UCI front end for the CPU player, for tournament harnesses such as cutechess-cli.
+
+    cutechess-cli -engine cmd="python castling_uci.py" proto=uci ...
+
+Supports position startpos/fen ... moves, go with wtime/btime/winc/binc/
+movestogo/movetime/depth/nodes/infinite/ponder, stop, ponderhit and the
+Threads and Move Overhead options. The rules have no en passant and always
+promote to a queen, so games that need either cannot be followed.
+"""
+import os
+import sys
+import time
+import threading
+
+# Headless: no window, and nothing but UCI on stdout
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import Castling_of_the_King_OMEGA7755 as game
+
+ENGINE_NAME = "Castling the King - CRSS"
+DEFAULT_MOVES_TO_GO = 30
+MIN_THINK_TIME = 0.005
+
+move_overhead = 0.05  # seconds kept back for the GUI and the pipe
+search_thread = None
+search_finished = threading.Event()  # set by stop/ponderhit in infinite or ponder mode
+pending_limits = None  # time limits to start when a ponder search is hit
+hit_deadlines = None  # (hard, soft) deadlines from ponderhit, for the search thread to pick up
+output_lock = threading.Lock()
+
+def send(line):
+    with output_lock:
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+
+def move_from_uci(text):
+    """Return the legal move for coordinate notation such as e2e4 or e7e8q, or None.
+
+    Pawns only promote to a queen here, so e7e8n and the like are refused
+    rather than played as a queen behind the GUI's back.
+    """
+    if len(text) not in (4, 5) or text[4:] not in ('', 'q'):
+        return None
+    try:
+        move = (game.parse_square(text[0:2]), game.parse_square(text[2:4]))
+    except (ValueError, IndexError):
+        return None
+    if move not in game.get_all_legal_moves(game.turn):
+        return None
+    (row, col), (t_row, _) = move
+    if text[4:] and not (game.board[row][col].type == 'p' and t_row in (0, 7)):
+        return None
+    return move
+
+def set_up_position(tokens):
+    """Handle `position startpos|fen <fen> [moves ...]`"""
+    if 'moves' in tokens:
+        split = tokens.index('moves')
+        setup, moves = tokens[:split], tokens[split + 1:]
+    else:
+        setup, moves = tokens, []
+    if setup and setup[0] == 'fen':
+        game.load_fen(' '.join(setup[1:]))
+    else:
+        game.load_fen(game.START_FEN)
+    for text in moves:
+        move = move_from_uci(text)
+        if move is None:
+            send(f"info string illegal or unsupported move {text}")
+            return
+        game.make_move(move)
+
+def allocate_time(params):
+    """Return (hard, soft) limits in seconds for a go command, or (None, None) to search without a clock.
+
+    The hard limit stops the search; no new depth starts after the soft limit.
+    Both stay well inside the remaining clock so the engine never flags.
+    """
+    if 'movetime' in params:
+        hard = max(MIN_THINK_TIME, params['movetime'] / 1000 - move_overhead)
+        return hard, hard
+    remaining = params.get('wtime' if game.turn == 'w' else 'btime')
+    if remaining is None:
+        return None, None
+    remaining /= 1000
+    increment = params.get('winc' if game.turn == 'w' else 'binc', 0) / 1000
+    moves_to_go = params.get('movestogo', DEFAULT_MOVES_TO_GO)
+    usable = max(MIN_THINK_TIME, remaining - move_overhead)
+    soft = remaining / moves_to_go + increment * 0.75
+    hard = min(usable * 0.5, soft * 3) if moves_to_go > 1 else usable * 0.9
+    hard = max(MIN_THINK_TIME, min(hard, usable))
+    return hard, min(soft, hard)
+
+def format_score(score):
+    if abs(score) > game.MATE_SCORE - game.MAX_PLY:
+        plies = game.MATE_SCORE - abs(score)
+        moves = (plies + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {score}"
+
+def apply_ponder_hit():
+    """search_poll hook: put a ponder search on the clock set by ponderhit.
+
+    Runs inside the search, after it started its own clock, so the deadlines
+    cannot be wiped by a ponderhit that arrives before the search gets going.
+    """
+    global hit_deadlines
+    if hit_deadlines is not None:
+        game.search_deadline, game.search_soft_deadline = hit_deadlines
+        hit_deadlines = None
+
+def run_search(params, infinite):
+    """Search thread: report every completed depth, then answer with bestmove"""
+    start = time.time()
+
+    def report(depth, score, move):
+        elapsed = max(time.time() - start, 0.001)
+        pv = ' '.join(game.move_to_uci(m) for m in game.principal_variation(move))
+        send(f"info depth {depth} score {format_score(score)} nodes {game.search_nodes} "
+             f"nps {int(game.search_nodes / elapsed)} time {int(elapsed * 1000)} pv {pv}")
+
+    hard, soft = (None, None) if infinite else allocate_time(params)
+    game.search_poll = apply_ponder_hit
+    best_move, reply = game.search_best_move(hard, params.get('depth', game.MAX_SEARCH_DEPTH),
+                                             report=report, soft_time_limit=soft,
+                                             node_limit=params.get('nodes'))
+    if infinite:
+        # UCI: no bestmove before stop or ponderhit, even if the search is done
+        search_finished.wait()
+    if best_move is None:
+        send("bestmove 0000")
+    elif reply is not None:
+        send(f"bestmove {game.move_to_uci(best_move)} ponder {game.move_to_uci(reply)}")
+    else:
+        send(f"bestmove {game.move_to_uci(best_move)}")
+
+def start_search(tokens):
+    """Handle `go ...`"""
+    global search_thread, pending_limits, hit_deadlines
+    params = {}
+    flags = set()
+    i = 0
+    while i < len(tokens):
+        if tokens[i] in ('infinite', 'ponder'):
+            flags.add(tokens[i])
+            i += 1
+        elif tokens[i] == 'searchmoves':
+            break
+        else:
+            if i + 1 < len(tokens):
+                try:
+                    params[tokens[i]] = int(tokens[i + 1])
+                except ValueError:
+                    pass
+            i += 2
+
+    search_finished.clear()
+    pending_limits = params if 'ponder' in flags else None
+    hit_deadlines = None
+    infinite = bool(flags)
+    search_thread = threading.Thread(target=run_search, args=(params, infinite), daemon=True)
+    search_thread.start()
+
+def stop_search():
+    """Stop a running search and wait for its bestmove"""
+    global search_thread
+    if search_thread is None:
+        return
+    search_finished.set()
+    # Keep asking: a search that has only just started resets the flag
+    while search_thread.is_alive():
+        game.search_stopped = True
+        search_thread.join(0.01)
+    search_thread = None
+
+def ponder_hit():
+    """The opponent played the expected move: put the ponder search on the clock"""
+    global pending_limits, hit_deadlines
+    if pending_limits is None:
+        return
+    # The board already holds the pondered position, so the clock starts now
+    hard, soft = allocate_time(pending_limits)
+    if hard is not None:
+        now = time.time()
+        hit_deadlines = (now + hard, now + soft)
+    pending_limits = None
+    search_finished.set()
+
+def set_option(tokens):
+    """Handle `setoption name <name> value <value>`"""
+    global move_overhead
+    if 'value' not in tokens:
+        return
+    split = tokens.index('value')
+    name = ' '.join(tokens[1:split]).lower()
+    value = ' '.join(tokens[split + 1:])
+    if name == 'threads':
+        game.SEARCH_PROCESSES = max(1, int(value))
+        if game.SEARCH_PROCESSES > 1:
+            # Fork the workers now, from the main thread, not from the search thread
+            game.start_search_workers(game.SEARCH_PROCESSES)
+    elif name == 'move overhead':
+        move_overhead = int(value) / 1000
+
+def main():
+    game.load_fen(game.START_FEN)
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        command = tokens[0]
+        if command == 'uci':
+            send(f"id name {ENGINE_NAME}")
+            send("id author Living Witness Network")
+            send(f"option name Threads type spin default 1 min 1 max {os.cpu_count() or 1}")
+            send("option name Move Overhead type spin default 50 min 0 max 5000")
+            send("option name Ponder type check default false")
+            send("uciok")
+        elif command == 'isready':
+            send("readyok")
+        elif command == 'setoption':
+            set_option(tokens[1:])
+        elif command == 'ucinewgame':
+            stop_search()
+            game.clear_search_state()
+        elif command == 'position':
+            stop_search()
+            set_up_position(tokens[1:])
+        elif command == 'go':
+            stop_search()
+            start_search(tokens[1:])
+        elif command == 'stop':
+            stop_search()
+        elif command == 'ponderhit':
+            ponder_hit()
+        elif command == 'quit':
+            break
+    stop_search()
+    game.stop_search_workers()
+
+if __name__ == "__main__":
+    main()